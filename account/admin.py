@@ -1,8 +1,14 @@
 from django.contrib import admin
-from .models import Profile
+from .models import OutboxEmail, Profile
 
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'date_of_birth', 'photo']
     raw_id_fields = ['user']
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'status', 'attempts', 'next_attempt', 'sent']
+    list_filter = ['status']
@@ -1,7 +1,40 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from account.models import Profile
 
 
+def user_cache_key(user_id):
+    return f"auth_user:{user_id}"
+
+
+def get_cached_user(user_id):
+    """
+    Return a user with their profile, from the cache when possible.
+    """
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.select_related("profile").filter(pk=user_id).first()
+        if user is not None:
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    Load the user of each request from the cache.
+    """
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if self.user_can_authenticate(user) else None
+
+
 class EmailAuthBackend:
     """
     Authenticate using an e-mail address.
@@ -16,10 +49,7 @@ class EmailAuthBackend:
             return None
 
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+        return get_cached_user(user_id)
 
 
 def create_profile(backend, user, *args, **kwargs):
@@ -0,0 +1,65 @@
+"""
+Friends-of-friends candidates from the follow graph.
+"""
+import numpy as np
+from scipy import sparse
+
+from bookmarks.parallel import get_shared, map_blocks
+
+
+def build_graph(from_ids, to_ids):
+    """
+    Build the CSR adjacency matrix of "follows" edges from parallel arrays
+    of user ids and return it with the user id of each row and column.
+    """
+    users, index = np.unique(
+        np.concatenate([from_ids, to_ids]), return_inverse=True
+    )
+    rows, columns = index[: len(from_ids)], index[len(from_ids) :]
+    data = np.ones(len(rows), dtype=np.int32)
+    graph = sparse.csr_matrix((data, (rows, columns)), shape=(len(users),) * 2)
+    graph.data[:] = 1
+    return graph, users
+
+
+def followers_of(graph, rows):
+    """
+    Return the rows of the users following any of the given rows.
+    """
+    columns = graph.tocsc()[:, rows]
+    return np.unique(columns.indices)
+
+
+def suggest_block(rows, limit):
+    """
+    Return the users followed by the users each row follows, ranked by the
+    number of mutual follows, as (row, candidate rows, counts) tuples.
+    """
+    graph, popularity = get_shared()
+    # entry (i, j) of A @ A counts the paths i -> k -> j
+    paths = (graph[rows] @ graph).tocsr()
+    suggestions = []
+    for i, row in enumerate(rows):
+        begin, end = paths.indptr[i], paths.indptr[i + 1]
+        candidates = paths.indices[begin:end]
+        counts = paths.data[begin:end]
+        followed = graph.indices[graph.indptr[row] : graph.indptr[row + 1]]
+        keep = (candidates != row) & ~np.isin(candidates, followed)
+        candidates, counts = candidates[keep], counts[keep]
+        # most mutual follows first, then the most followed users
+        order = np.lexsort((candidates, -popularity[candidates], -counts))[:limit]
+        suggestions.append((row, candidates[order], counts[order]))
+    return suggestions
+
+
+def suggest(graph, rows, limit=10, block_size=1000, workers=1):
+    """
+    Yield the suggestions of each of the given rows of the graph.
+    """
+    popularity = np.asarray(graph.sum(axis=0)).ravel()
+    blocks = [
+        rows[start : start + block_size] for start in range(0, len(rows), block_size)
+    ]
+    return map_blocks(
+        suggest_block, (graph, popularity), blocks, limit, workers=workers
+    )
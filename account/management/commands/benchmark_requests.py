@@ -0,0 +1,39 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+class Command(BaseCommand):
+    help = "Measure queries and latency of pages requested by a logged in user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Page to request (repeatable), defaults to the dashboard.",
+        )
+        parser.add_argument("--requests", type=int, default=100)
+
+    def handle(self, *args, **options):
+        client = Client()
+        client.force_login(User.objects.get(username=options["username"]))
+        for path in options["paths"] or ["/account/"]:
+            # the first request warms up caches
+            client.get(path)
+            queries = 0
+            start = time.perf_counter()
+            for _ in range(options["requests"]):
+                with CaptureQueriesContext(connection) as context:
+                    client.get(path)
+                queries += len(context)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{path}: {queries / options['requests']:.1f} queries, "
+                f"{elapsed / options['requests'] * 1000:.1f} ms per request"
+            )
@@ -0,0 +1,79 @@
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from account.graph import build_graph, followers_of, suggest
+from account.suggestions import (
+    DIRTY_KEY,
+    load_contacts,
+    r,
+    store_suggestions,
+    suggestions_key,
+)
+
+
+class Command(BaseCommand):
+    help = "Compute the friends-of-friends suggestions of users."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recompute every user, not only those whose contacts changed.",
+        )
+        parser.add_argument("--block-size", type=int, default=1000)
+        parser.add_argument("--chunk-size", type=int, default=100000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes, defaults to the number of cores.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        # changes made during the run stay dirty for the next one
+        dirty = {int(user_id) for user_id in r.smembers(DIRTY_KEY)}
+        if not dirty and not options["all"]:
+            self.stdout.write("No contacts changed since the last run.")
+            return
+        graph, users = build_graph(*load_contacts(options["chunk_size"]))
+        if options["all"]:
+            rows = np.arange(len(users))
+            stale = [
+                key.decode()
+                for key in r.scan_iter(match=suggestions_key("*"))
+                if key.split(b":")[1].isdigit()
+            ]
+        else:
+            dirty_rows = np.flatnonzero(np.isin(users, list(dirty)))
+            # following someone changes the suggestions of the user and of
+            # everyone following them
+            rows = np.union1d(dirty_rows, followers_of(graph, dirty_rows))
+            stale = [
+                suggestions_key(user_id)
+                for user_id in dirty - set(users[dirty_rows].tolist())
+            ]
+        suggestions = suggest(
+            graph,
+            rows,
+            limit=options["top"],
+            block_size=options["block_size"],
+            workers=options["workers"],
+        )
+        stored = set(store_suggestions(suggestions, users))
+        # users left without any contact have no suggestions
+        stale = [key for key in stale if int(key.split(":")[1]) not in stored]
+        if stale:
+            r.delete(*stale)
+        if dirty:
+            r.srem(DIRTY_KEY, *dirty)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Computed the suggestions of {len(stored)} users "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+        )
@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from account.models import OutboxEmail
+from account.outbox import deliver, get_delivery_connection
+
+
+class Command(BaseCommand):
+    help = "Deliver the e-mails queued in the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when there is nothing to send.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when the outbox is empty."
+        )
+
+    def handle(self, *args, **options):
+        # a single connection is reused for every batch
+        connection = get_delivery_connection()
+        try:
+            while True:
+                processed = self.process_batch(connection, options["batch_size"])
+                if not processed:
+                    if options["once"]:
+                        break
+                    # don't keep an idle connection to the mail server
+                    connection.close()
+                    time.sleep(options["interval"])
+        finally:
+            connection.close()
+
+    def process_batch(self, connection, batch_size):
+        with transaction.atomic():
+            # skip rows locked by other workers so several can run at once
+            emails = list(
+                OutboxEmail.objects.select_for_update(skip_locked=True)
+                .filter(
+                    status=OutboxEmail.Status.QUEUED,
+                    next_attempt__lte=timezone.now(),
+                )
+                .order_by("next_attempt")[:batch_size]
+            )
+            if emails:
+                sent = deliver(emails, connection)
+                if sent < len(emails):
+                    self.stderr.write(f"{len(emails) - sent} e-mails failed")
+        return len(emails)
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_profile_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['user_to', 'user_from'], name='account_con_user_to_990b12_idx'),
+        ),
+        # drop duplicate follows before making them unique
+        migrations.RunSQL(
+            """
+            DELETE FROM account_contact a USING account_contact b
+            WHERE a.user_from_id = b.user_from_id
+            AND a.user_to_id = b.user_to_id
+            AND a.id > b.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        # count the contacts left once duplicates are gone
+        migrations.RunSQL(
+            """
+            UPDATE account_profile p SET
+                followers_count = (
+                    SELECT COUNT(*) FROM account_contact c
+                    WHERE c.user_to_id = p.user_id
+                ),
+                following_count = (
+                    SELECT COUNT(*) FROM account_contact c
+                    WHERE c.user_from_id = p.user_id
+                )
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='contact',
+            constraint=models.UniqueConstraint(fields=('user_from', 'user_to'), name='account_contact_unique'),
+        ),
+    ]
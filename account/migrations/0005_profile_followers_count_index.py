@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_profile_followers_count_profile_following_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-followers_count'], name='account_pro_followe_1b7014_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import AccessMixin
+from django.core.handlers.asgi import ASGIRequest
+from images.counters import close_async_redis
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """
+    LoginRequiredMixin for views with async handlers.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        # loading request.user may query the database, which can't be done
+        # from the event loop
+        is_authenticated = await sync_to_async(
+            lambda: request.user.is_authenticated
+        )()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        finally:
+            if not isinstance(request, ASGIRequest):
+                # under WSGI the event loop only lives for this request
+                await close_async_redis()
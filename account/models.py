@@ -1,12 +1,51 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+class ProfileQuerySet(models.QuerySet):
+    def recount_follows(self):
+        """
+        Recompute followers_count and following_count from the contacts
+        table, writing only the profiles whose stored counts have drifted.
+        """
+        repaired = 0
+        for count_field, user_field in (
+            ("followers_count", "user_to"),
+            ("following_count", "user_from"),
+        ):
+            contacts = (
+                Contact.objects.filter(**{user_field: OuterRef("user")})
+                .order_by()
+                .values(user_field)
+                .annotate(total=Count("*"))
+                .values("total")
+            )
+            total = Coalesce(Subquery(contacts), 0)
+            repaired += self.exclude(**{count_field: total}).update(
+                **{count_field: total}
+            )
+        return repaired
 
 
 class Profile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     date_of_birth = models.DateField(blank=True, null=True)
     photo = models.ImageField(upload_to="users/%Y/%m/%d/", blank=True)
+    # precomputed thumbnail URLs and sizes, see images.thumbnails
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-followers_count"]),
+        ]
 
     def __str__(self):
         return f"Profile of {self.user.username}"
@@ -24,6 +63,12 @@ class Contact(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["-created"]),
+            models.Index(fields=["user_to", "user_from"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_from", "user_to"], name="account_contact_unique"
+            ),
         ]
         ordering = ["-created"]
 
@@ -31,6 +76,41 @@ class Contact(models.Model):
         return f"{self.user_from} follows {self.user_to}"
 
 
+class OutboxEmail(models.Model):
+    """
+    An e-mail waiting to be delivered by the send_queued_mail command.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    # the fields of the EmailMessage, see account.outbox
+    message = models.JSONField()
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt"],
+                condition=models.Q(status="queued"),
+                name="account_outbox_queued_idx",
+            ),
+        ]
+        ordering = ["-created"]
+
+    def __str__(self):
+        return f"{self.message['subject']} to {', '.join(self.message['to'])}"
+
+
 # Add following field to User dynamically
 user_model = get_user_model()
 user_model.add_to_class(
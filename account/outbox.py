@@ -0,0 +1,107 @@
+import base64
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+def serialize_message(message):
+    """
+    Return the fields of an EmailMessage as JSON-serializable data.
+    """
+    return {
+        "subject": message.subject,
+        "body": message.body,
+        "from_email": message.from_email,
+        "to": message.to,
+        "cc": message.cc,
+        "bcc": message.bcc,
+        "reply_to": message.reply_to,
+        "headers": message.extra_headers,
+        "content_subtype": message.content_subtype,
+        "alternatives": getattr(message, "alternatives", []),
+        "attachments": [
+            [filename, base64.b64encode(_as_bytes(content)).decode(), mimetype]
+            for filename, content, mimetype in message.attachments
+        ],
+    }
+
+
+def _as_bytes(content):
+    return content.encode() if isinstance(content, str) else content
+
+
+def deserialize_message(data, connection=None):
+    message = EmailMultiAlternatives(
+        subject=data["subject"],
+        body=data["body"],
+        from_email=data["from_email"],
+        to=data["to"],
+        cc=data["cc"],
+        bcc=data["bcc"],
+        reply_to=data["reply_to"],
+        headers=data["headers"],
+        alternatives=[tuple(alternative) for alternative in data["alternatives"]],
+        connection=connection,
+    )
+    message.content_subtype = data["content_subtype"]
+    for filename, content, mimetype in data["attachments"]:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """
+    Queue messages in the outbox table instead of sending them during the
+    request. They are committed with the rest of the request's changes.
+    """
+
+    def send_messages(self, email_messages):
+        outbox = [
+            OutboxEmail(message=serialize_message(message))
+            for message in email_messages
+            if message.recipients()
+        ]
+        OutboxEmail.objects.bulk_create(outbox)
+        return len(outbox)
+
+
+def get_delivery_connection():
+    return get_connection(settings.EMAIL_DELIVERY_BACKEND, fail_silently=False)
+
+
+def deliver(emails, connection):
+    """
+    Send queued e-mails over an open connection, scheduling failed ones
+    for a retry with exponential backoff. Returns the number sent.
+    """
+    sent = 0
+    for email in emails:
+        email.attempts += 1
+        try:
+            # does nothing if the connection is already open
+            connection.open()
+            connection.send_messages([deserialize_message(email.message)])
+        except Exception as e:
+            email.last_error = f"{type(e).__name__}: {e}"
+            if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                email.status = OutboxEmail.Status.FAILED
+            else:
+                delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+                email.next_attempt = timezone.now() + datetime.timedelta(
+                    seconds=delay
+                )
+            # the connection may be broken, reopen it for the next message
+            connection.close()
+        else:
+            email.status = OutboxEmail.Status.SENT
+            email.sent = timezone.now()
+            sent += 1
+    OutboxEmail.objects.bulk_update(
+        emails, ["status", "attempts", "next_attempt", "last_error", "sent"]
+    )
+    return sent
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from images.thumbnails import schedule_thumbnails, thumbnails_generated
+
+from .authentication import invalidate_cached_user
+from .models import Profile
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, **kwargs):
+    if instance.photo:
+        schedule_thumbnails(instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # covers profile edits, password changes and account activation
+    invalidate_cached_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.user_id)
+
+
+@receiver(thumbnails_generated, sender=Profile)
+def profile_thumbnails_changed(sender, pk, **kwargs):
+    # stored with update(), which doesn't send post_save
+    user_id = Profile.objects.filter(pk=pk).values_list("user_id", flat=True)
+    if user_id:
+        invalidate_cached_user(user_id[0])
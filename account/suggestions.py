@@ -0,0 +1,62 @@
+import numpy as np
+from django.db import transaction
+
+from images.counters import r
+from images.recommendations import replace_zsets
+
+from .models import Contact
+
+# users who followed or unfollowed someone since the last run
+DIRTY_KEY = "suggestions:dirty"
+
+
+def suggestions_key(user_id):
+    return f"suggestions:{user_id}"
+
+
+def mark_dirty(user_id, client=r):
+    """
+    Recompute the suggestions affected by a follow or unfollow of a user
+    on the next run, once the current transaction commits.
+    """
+    transaction.on_commit(lambda: client.sadd(DIRTY_KEY, user_id))
+
+
+def get_suggestions(user_id, limit=10, client=r):
+    """
+    Return the ids of the users suggested to a user, best first.
+    """
+    suggestions = client.zrevrange(suggestions_key(user_id), 0, limit - 1)
+    return [int(id) for id in suggestions]
+
+
+def load_contacts(chunk_size=100000):
+    """
+    Read the contacts table in chunks and return parallel arrays of
+    follower and followed user ids.
+    """
+    contacts = Contact.objects.order_by().values_list("user_from_id", "user_to_id")
+    rows = contacts.iterator(chunk_size=chunk_size)
+    edges = np.fromiter((user_id for row in rows for user_id in row), dtype=np.int64)
+    return edges[0::2], edges[1::2]
+
+
+def store_suggestions(suggestions, users, client=r, batch_size=1000):
+    """
+    Replace the stored suggestions of each user. Returns the ids of the
+    users stored.
+    """
+    stored = []
+
+    def suggestion_zsets():
+        for row, candidates, _ in suggestions:
+            user_id = int(users[row])
+            stored.append(user_id)
+            # scored by rank to keep the popularity order of ties
+            yield suggestions_key(user_id), {
+                int(users[candidate]): len(candidates) - rank
+                for rank, candidate in enumerate(candidates)
+            }
+
+    replace_zsets(suggestion_zsets(), client, batch_size)
+    return stored
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import datetime
+import json
+import socket
+from email import message_from_bytes
+from io import StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+import redis
+from actions import feed
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from images.models import Image
+from images.thumbnails import thumbnails_generated
+
+from .authentication import get_cached_user
+from .models import Contact, OutboxEmail, Profile
+from .outbox import deserialize_message, serialize_message
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class UserPagesQueriesTest(TestCase):
+    """
+    The user list and detail pages run a fixed number of queries however
+    many followers and images the users have.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user("viewer")
+        cls.author = cls.create_user("author")
+
+    @staticmethod
+    def create_user(username):
+        user = User.objects.create_user(username, password="secret")
+        Profile.objects.create(user=user)
+        return user
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+        self.created = 0
+
+    @staticmethod
+    def image(user, n):
+        name = f"images/{n}.jpg"
+        thumbnail = {"url": f"/media/{name}", "width": 300, "height": 300}
+        return Image(
+            user=user,
+            title=f"Image {n}",
+            slug=f"image-{n}",
+            url=f"https://example.com/{n}.jpg",
+            image=name,
+            # as stored once the thumbnails are generated
+            thumbnails={"source": name, "list": thumbnail, "small": thumbnail},
+        )
+
+    def grow(self, followers=5, images=5):
+        created = []
+        for _ in range(followers):
+            self.created += 1
+            follower = self.create_user(f"follower{self.created}")
+            Contact.objects.create(user_from=follower, user_to=self.author)
+            created.append(self.image(follower, self.created))
+        for _ in range(images):
+            self.created += 1
+            created.append(self.image(self.author, self.created))
+        Image.objects.bulk_create(created)
+
+    def assertConstantQueries(self, url):
+        self.grow(followers=1, images=1)
+        # the first request warms up the session and the user cache
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.grow(followers=20, images=20)
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_user_detail(self):
+        self.assertConstantQueries(reverse("user_detail", args=["author"]))
+
+    def test_user_detail_images_only(self):
+        url = reverse("user_detail", args=["author"])
+        self.assertConstantQueries(f"{url}?images_only=1")
+
+    def test_user_list(self):
+        self.assertConstantQueries(reverse("user_list"))
+
+
+
+@override_settings(ACTIVITY_FEED_ENABLED=True)
+class UserFollowViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.follower = UserPagesQueriesTest.create_user("follower")
+        cls.followed = UserPagesQueriesTest.create_user("followed")
+
+    def setUp(self):
+        self.client.force_login(self.follower)
+
+    def post(self, action):
+        response = self.client.post(
+            reverse("user_follow"), {"id": self.followed.id, "action": action}
+        )
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_feed_outage(self):
+        error = redis.ConnectionError("Redis is down")
+        with mock.patch.object(
+            feed, "aadd_user_actions", side_effect=error
+        ), self.assertLogs("account.views", "ERROR"):
+            self.post("follow")
+        self.assertTrue(self.follower.following.filter(id=self.followed.id).exists())
+        self.assertEqual(Profile.objects.get(user=self.followed).followers_count, 1)
+        with mock.patch.object(
+            feed, "aremove_user_actions", side_effect=error
+        ), self.assertLogs("account.views", "ERROR"):
+            self.post("unfollow")
+        self.assertFalse(self.follower.following.exists())
+        self.assertEqual(Profile.objects.get(user=self.followed).followers_count, 0)
+
+
+class CachedUserTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.follower = UserPagesQueriesTest.create_user("follower")
+        cls.followed = UserPagesQueriesTest.create_user("followed")
+
+    def setUp(self):
+        self.client.force_login(self.follower)
+
+    def follow(self, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("user_follow"), {"id": self.followed.id, "action": action}
+            )
+
+    def assertCounts(self, following, followers):
+        self.assertEqual(
+            get_cached_user(self.follower.id).profile.following_count, following
+        )
+        self.assertEqual(
+            get_cached_user(self.followed.id).profile.followers_count, followers
+        )
+
+    def test_follow_counts(self):
+        self.assertCounts(0, 0)
+        self.follow("follow")
+        self.assertCounts(1, 1)
+        self.follow("unfollow")
+        self.assertCounts(0, 0)
+
+    def test_thumbnails(self):
+        profile = get_cached_user(self.follower.id).profile
+        self.assertEqual(profile.thumbnails, {})
+        thumbnails = {"source": "users/a.jpg"}
+        Profile.objects.filter(pk=profile.pk).update(thumbnails=thumbnails)
+        thumbnails_generated.send(sender=Profile, pk=profile.pk)
+        self.assertEqual(
+            get_cached_user(self.follower.id).profile.thumbnails, thumbnails
+        )
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.sessions = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if session not in self.sessions:
+            self.sessions.append(session)
+        self.messages.append(message_from_bytes(envelope.content))
+        return "250 Message accepted for delivery"
+
+
+@skipIf(Controller is None, "aiosmtpd is not installed")
+@override_settings(
+    EMAIL_BACKEND="account.outbox.OutboxEmailBackend",
+    EMAIL_DELIVERY_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+    EMAIL_HOST="127.0.0.1",
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_DELAY=60,
+)
+class OutboxTest(TestCase):
+    def start_server(self):
+        handler = RecordingHandler()
+        controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        self.addCleanup(controller.stop)
+        return handler, controller.port
+
+    def queue(self, count=1):
+        for n in range(count):
+            mail.send_mail(
+                f"Message {n}", "Hello", "from@example.com", [f"user{n}@example.com"]
+            )
+        self.now = timezone.now()
+
+    def send_queued_mail(self, port):
+        with self.settings(EMAIL_PORT=port), mock.patch.object(
+            timezone, "now", return_value=self.now
+        ):
+            call_command("send_queued_mail", "--once", stderr=StringIO())
+
+    def test_queue_and_deliver(self):
+        handler, port = self.start_server()
+        self.queue(3)
+        self.assertEqual(
+            OutboxEmail.objects.filter(status=OutboxEmail.Status.QUEUED).count(), 3
+        )
+        self.assertEqual(handler.messages, [])
+        self.send_queued_mail(port)
+        self.assertEqual(
+            sorted(message["Subject"] for message in handler.messages),
+            ["Message 0", "Message 1", "Message 2"],
+        )
+        # every message went over a single connection
+        self.assertEqual(len(handler.sessions), 1)
+        for email in OutboxEmail.objects.all():
+            self.assertEqual(email.status, OutboxEmail.Status.SENT)
+            self.assertEqual(email.attempts, 1)
+            self.assertEqual(email.sent, self.now)
+
+    def test_retry_with_backoff(self):
+        refused = free_port()
+        self.queue()
+        start = self.now
+        self.send_queued_mail(refused)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.Status.QUEUED)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("ConnectionRefusedError", email.last_error)
+        self.assertEqual(email.next_attempt, start + datetime.timedelta(seconds=60))
+        # not retried before the next attempt is due
+        self.send_queued_mail(refused)
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.now = email.next_attempt
+        self.send_queued_mail(refused)
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 2)
+        self.assertEqual(email.next_attempt, self.now + datetime.timedelta(seconds=120))
+        handler, port = self.start_server()
+        self.now = email.next_attempt
+        self.send_queued_mail(port)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.SENT)
+        self.assertEqual(email.attempts, 3)
+        self.assertEqual(len(handler.messages), 1)
+
+    def test_failed_after_max_attempts(self):
+        refused = free_port()
+        self.queue()
+        email = OutboxEmail.objects.get()
+        for _ in range(3):
+            self.now = OutboxEmail.objects.get().next_attempt
+            self.send_queued_mail(refused)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.Status.FAILED)
+        self.assertEqual(email.attempts, 3)
+        # failed e-mails are not retried
+        self.now += datetime.timedelta(days=1)
+        handler, port = self.start_server()
+        self.send_queued_mail(port)
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 3)
+        self.assertEqual(handler.messages, [])
+
+    def test_serialize_round_trip(self):
+        message = mail.EmailMultiAlternatives(
+            subject="Welcome",
+            body="Hello",
+            from_email="from@example.com",
+            to=["to@example.com"],
+            cc=["cc@example.com"],
+            bcc=["bcc@example.com"],
+            reply_to=["reply@example.com"],
+            headers={"X-Campaign": "welcome"},
+        )
+        message.attach_alternative("<p>Hello</p>", "text/html")
+        message.attach("notes.txt", "Some notes", "text/plain")
+        message.attach("logo.png", b"\x89PNG\r\n\x1a\n\x00\xff", "image/png")
+        data = json.loads(json.dumps(serialize_message(message)))
+        copy = deserialize_message(data)
+        for field in (
+            "subject",
+            "body",
+            "from_email",
+            "to",
+            "cc",
+            "bcc",
+            "reply_to",
+            "extra_headers",
+            "content_subtype",
+            "alternatives",
+            "attachments",
+        ):
+            self.assertEqual(getattr(copy, field), getattr(message, field), field)
+        self.assertEqual(copy.recipients(), message.recipients())
@@ -1,7 +1,13 @@
+import logging
 from typing import Any
 
+import redis
+from asgiref.sync import sync_to_async
+from actions import feed
 from actions.models import Action
+from actions.snapshots import ensure_snapshots
 from actions.utils import create_action
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
@@ -19,21 +25,33 @@ from django.contrib.auth.views import (
 )
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
 from django.db.models.query import QuerySet
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils.decorators import method_decorator
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
 from django.views import View
-from django.views.decorators.http import require_POST
 from django.views.generic import DetailView, FormView, ListView, UpdateView
+from images.models import Image
+from images.pagination import CursorPaginator, InvalidCursor
 
+from . import suggestions
+from .authentication import invalidate_cached_user
 from .forms import ProfileEditForm, UserEditForm, UserRegistrationForm
+from .mixins import AsyncLoginRequiredMixin
 from .models import Contact, Profile
 from .tokens import account_activation_token
 from .utils import activate_email
 
+logger = logging.getLogger(__name__)
+
 User = get_user_model()
 
 
@@ -137,17 +155,20 @@ class DashboardView(LoginRequiredMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self) -> QuerySet[Any]:
-        queryset = Action.objects.exclude(user=self.request.user)
         following_ids = self.request.user.following.values_list("id", flat=True)
-        if following_ids:
+        is_following = following_ids.exists()
+        if settings.ACTIVITY_FEED_ENABLED and is_following:
+            # read the precomputed feed instead of scanning the actions table
+            return feed.UserFeed(self.request.user.id)
+        queryset = Action.objects.exclude(user=self.request.user)
+        if is_following:
             queryset = queryset.filter(user_id__in=following_ids)
-        return queryset.select_related("user", "user__profile").prefetch_related(
-            "target"
-        )
+        return queryset
 
     def get_context_data(self, **kwargs) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
         context["section"] = "dashboard"
+        context["actions"] = ensure_snapshots(list(context["actions"]))
         return context
 
 
@@ -198,50 +219,154 @@ class UserListView(LoginRequiredMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return User.objects.filter(is_active=True, is_staff=False)
+        # most followed accounts first
+        return (
+            User.objects.filter(is_active=True, is_staff=False)
+            .exclude(id=self.request.user.id)
+            .select_related("profile")
+            .order_by("-profile__followers_count", "id")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["suggested_users"] = self.get_suggested_users()
+        return context
+
+    def get_suggested_users(self):
+        user_ids = suggestions.get_suggestions(
+            self.request.user.id, settings.USER_SUGGESTIONS_SIZE
+        )
+        if not user_ids:
+            return []
+        # suggestions are computed in batch, skip users followed since
+        users = (
+            User.objects.filter(id__in=user_ids, is_active=True, is_staff=False)
+            .exclude(followers__id=self.request.user.id)
+            .select_related("profile")
+            .in_bulk()
+        )
+        return [users[id] for id in user_ids if id in users]
 
 
 class UserDetailView(LoginRequiredMixin, DetailView):
     model = User
     template_name = "account/user/detail.html"
     context_object_name = "user"
+    paginate_by = 8
 
     def get_queryset(self):
-        return User.objects.filter(is_active=True)
+        is_followed = Contact.objects.filter(
+            user_from=self.request.user, user_to=OuterRef("pk")
+        )
+        return (
+            User.objects.filter(is_active=True)
+            .select_related("profile")
+            .annotate(is_followed=Exists(is_followed))
+        )
 
     def get_object(self, queryset=None):
         username = self.kwargs.get("username")
-        return get_object_or_404(User, username=username, is_active=True)
-
+        return get_object_or_404(self.get_queryset(), username=username)
 
-class UserFollowView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        paginator = CursorPaginator(
+            self.object.images_created.filter(status=Image.Status.READY),
+            ("-created", "-id"),
+            self.paginate_by,
+        )
+        try:
+            images = paginator.page(request.GET.get("cursor"))
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor")
+
+        if request.GET.get("images_only"):
+            if not images:
+                return HttpResponse("")
+            response = render(
+                request, "images/image/list_images.html", {"images": images}
+            )
+        else:
+            context = self.get_context_data(
+                object=self.object, images=images, next_cursor=images.next_cursor
+            )
+            response = self.render_to_response(context)
+        if images.next_cursor:
+            response["X-Next-Cursor"] = images.next_cursor
+        return response
 
-    @method_decorator(require_POST)
-    def dispatch(self, request, *args, **kwargs):
-        return super().dispatch(request, *args, **kwargs)
 
-    def post(self, request, *args, **kwargs):
+class UserFollowView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
         user_id = request.POST.get("id")
         action = request.POST.get("action")
         if user_id and action:
-            return self.handle_follow_action(request, user_id, action)
+            return await self.handle_follow_action(request, user_id, action)
         return JsonResponse({"status": "error"})
 
-    def handle_follow_action(self, request, user_id, action):
+    async def handle_follow_action(self, request, user_id, action):
         try:
-            user = User.objects.get(id=user_id)
+            user = await User.objects.aget(id=user_id)
             if action == "follow":
-                return self.follow_user(request, user)
+                return await self.follow_user(request, user)
             elif action == "unfollow":
-                return self.unfollow_user(request, user)
+                return await self.unfollow_user(request, user)
         except User.DoesNotExist:
             return JsonResponse({"status": "error"})
 
-    def follow_user(self, request, user):
-        Contact.objects.get_or_create(user_from=request.user, user_to=user)
-        create_action(request.user, "is following", user)
+    async def follow_user(self, request, user):
+        # transactions can't be used from async code yet
+        if await sync_to_async(self.follow)(request.user, user):
+            if settings.ACTIVITY_FEED_ENABLED:
+                await self.update_feed(feed.aadd_user_actions, request.user, user)
+        await sync_to_async(create_action)(request.user, "is following", user)
         return JsonResponse({"status": "ok"})
 
-    def unfollow_user(self, request, user):
-        Contact.objects.filter(user_from=request.user, user_to=user).delete()
+    async def unfollow_user(self, request, user):
+        if await sync_to_async(self.unfollow)(request.user, user):
+            if settings.ACTIVITY_FEED_ENABLED:
+                await self.update_feed(feed.aremove_user_actions, request.user, user)
         return JsonResponse({"status": "ok"})
+
+    async def update_feed(self, update, user_from, user_to):
+        # the contact is already committed, a Redis outage must not fail it
+        try:
+            await update(user_from.id, user_to.id)
+        except redis.RedisError:
+            logger.exception("Could not update the activity feed of %s", user_from)
+
+    def follow(self, user_from, user_to):
+        with transaction.atomic():
+            _, created = Contact.objects.get_or_create(
+                user_from=user_from, user_to=user_to
+            )
+            if created:
+                Profile.objects.filter(user=user_from).update(
+                    following_count=F("following_count") + 1
+                )
+                Profile.objects.filter(user=user_to).update(
+                    followers_count=F("followers_count") + 1
+                )
+                suggestions.mark_dirty(user_from.id)
+                # update() doesn't send post_save, refresh the cached profiles
+                transaction.on_commit(lambda: invalidate_cached_user(user_from.id))
+                transaction.on_commit(lambda: invalidate_cached_user(user_to.id))
+        return created
+
+    def unfollow(self, user_from, user_to):
+        with transaction.atomic():
+            deleted, _ = Contact.objects.filter(
+                user_from=user_from, user_to=user_to
+            ).delete()
+            if deleted:
+                Profile.objects.filter(
+                    user=user_from, following_count__gt=0
+                ).update(following_count=F("following_count") - 1)
+                Profile.objects.filter(user=user_to, followers_count__gt=0).update(
+                    followers_count=F("followers_count") - 1
+                )
+                suggestions.mark_dirty(user_from.id)
+                # update() doesn't send post_save, refresh the cached profiles
+                transaction.on_commit(lambda: invalidate_cached_user(user_from.id))
+                transaction.on_commit(lambda: invalidate_cached_user(user_to.id))
+        return deleted
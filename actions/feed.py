@@ -0,0 +1,219 @@
+import datetime
+from collections import defaultdict
+from itertools import islice
+
+import redis
+from account.models import Contact
+from django.conf import settings
+from images.counters import get_async_redis
+
+from . import live
+from .models import Action
+
+# connect to redis
+r = redis.Redis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+)
+
+# followers are written to in chunks so one pipeline never grows unbounded
+FANOUT_BATCH_SIZE = 1000
+
+
+def feed_key(user_id):
+    return f"feed:{user_id}"
+
+
+def _score(action):
+    return action.created.timestamp()
+
+
+def _created(score):
+    return datetime.datetime.fromtimestamp(score, datetime.timezone.utc)
+
+
+def _follower_ids(user_id):
+    return Contact.objects.filter(user_to_id=user_id).values_list(
+        "user_from_id", flat=True
+    )
+
+
+def push_action(action):
+    """
+    Fan out a new action to the feed of every follower of its author.
+    """
+    push_actions([action])
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def push_actions(actions, feeds=True, stream=False):
+    """
+    Fan out several new actions, looking up the followers of each author
+    only once: to the feed of every follower, and if stream is true to
+    the followers with a live stream open, see actions.live.
+    """
+    length = settings.ACTIVITY_FEED_LENGTH
+    actions_by_user = defaultdict(list)
+    for action in actions:
+        actions_by_user[action.user_id].append(action)
+    pipe = r.pipeline(transaction=False)
+    for user_id, user_actions in actions_by_user.items():
+        mapping = {action.id: _score(action) for action in user_actions}
+        messages = (
+            [live.render_message(action) for action in user_actions] if stream else []
+        )
+        followers = _follower_ids(user_id).iterator()
+        for follower_ids in _batches(followers, FANOUT_BATCH_SIZE):
+            if feeds:
+                for follower_id in follower_ids:
+                    key = feed_key(follower_id)
+                    pipe.zadd(key, mapping)
+                    # keep only the most recent entries
+                    pipe.zremrangebyrank(key, 0, -length - 1)
+            if not stream:
+                pipe.execute()
+                continue
+            pipe.zmscore(live.STREAMS_KEY, follower_ids)
+            expiries = pipe.execute()[-1]
+            # sent with the next batch
+            live.queue_messages(pipe, follower_ids, expiries, messages)
+    if len(pipe):
+        pipe.execute()
+
+
+def add_user_actions(user_id, followed_id):
+    """
+    Merge the recent actions of a newly followed user into a feed.
+    """
+    length = settings.ACTIVITY_FEED_LENGTH
+    actions = Action.objects.filter(user_id=followed_id).values_list("id", "created")[
+        :length
+    ]
+    mapping = {action_id: created.timestamp() for action_id, created in actions}
+    if not mapping:
+        return
+    key = feed_key(user_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.zadd(key, mapping)
+    pipe.zremrangebyrank(key, 0, -length - 1)
+    pipe.execute()
+
+
+async def aadd_user_actions(user_id, followed_id):
+    """
+    Asyncio version of add_user_actions().
+    """
+    length = settings.ACTIVITY_FEED_LENGTH
+    actions = Action.objects.filter(user_id=followed_id).values_list("id", "created")[
+        :length
+    ]
+    mapping = {action_id: created.timestamp() async for action_id, created in actions}
+    if not mapping:
+        return
+    key = feed_key(user_id)
+    pipe = get_async_redis().pipeline(transaction=False)
+    pipe.zadd(key, mapping)
+    pipe.zremrangebyrank(key, 0, -length - 1)
+    await pipe.execute()
+
+
+def remove_user_actions(user_id, followed_id):
+    """
+    Drop the actions of an unfollowed user from a feed.
+    """
+    length = settings.ACTIVITY_FEED_LENGTH
+    action_ids = list(
+        Action.objects.filter(user_id=followed_id).values_list("id", flat=True)[
+            :length
+        ]
+    )
+    if action_ids:
+        r.zrem(feed_key(user_id), *action_ids)
+
+
+async def aremove_user_actions(user_id, followed_id):
+    """
+    Asyncio version of remove_user_actions().
+    """
+    length = settings.ACTIVITY_FEED_LENGTH
+    actions = Action.objects.filter(user_id=followed_id).values_list("id", flat=True)[
+        :length
+    ]
+    action_ids = [action_id async for action_id in actions]
+    if action_ids:
+        await get_async_redis().zrem(feed_key(user_id), *action_ids)
+
+
+def rebuild_feed(user_id):
+    """
+    Rebuild a feed from the database. Used to backfill existing users.
+    """
+    length = settings.ACTIVITY_FEED_LENGTH
+    following_ids = Contact.objects.filter(user_from_id=user_id).values_list(
+        "user_to_id", flat=True
+    )
+    actions = Action.objects.filter(user_id__in=following_ids).values_list(
+        "id", "created"
+    )[:length]
+    key = feed_key(user_id)
+    pipe = r.pipeline()
+    pipe.delete(key)
+    mapping = {action_id: created.timestamp() for action_id, created in actions}
+    if mapping:
+        pipe.zadd(key, mapping)
+    pipe.execute()
+    return len(mapping)
+
+
+class UserFeed:
+    """
+    Lazy, sliceable view over a user's feed so it can be handed to a
+    Paginator in place of a queryset.
+    """
+
+    model = Action
+
+    def __init__(self, user_id):
+        self.key = feed_key(user_id)
+
+    def count(self):
+        return r.zcard(self.key)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k : k + 1][0]
+        start = k.start or 0
+        if k.stop is None:
+            stop = -1
+        elif k.stop <= start:
+            return []
+        else:
+            stop = k.stop - 1
+        entries = r.zrevrange(self.key, start, stop, withscores=True)
+        return self.hydrate(
+            [int(id) for id, _ in entries], [score for _, score in entries]
+        )
+
+    @staticmethod
+    def hydrate(action_ids, scores=None):
+        # the snapshot holds everything the feed shows of the user and target
+        actions = Action.objects.filter(id__in=action_ids)
+        if scores:
+            # bounding created lets Postgres skip the other monthly
+            # partitions; a second of margin covers the rounding of scores
+            actions = actions.filter(
+                created__range=(
+                    _created(min(scores) - 1),
+                    _created(max(scores) + 1),
+                )
+            )
+        actions_by_id = {action.id: action for action in actions}
+        # actions deleted after being pushed are skipped
+        return [actions_by_id[id] for id in action_ids if id in actions_by_id]
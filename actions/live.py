@@ -0,0 +1,259 @@
+"""
+Live activity feed over server-sent events.
+
+Every process of the ASGI deployment keeps a single pub/sub connection,
+subscribed to the channels of the users with an open stream, and forwards
+each message to their streams. The users with an open stream are kept in
+the STREAMS_KEY zset, so the fan-out of new actions in
+actions.feed.push_actions() only publishes to them.
+"""
+import asyncio
+import io
+import json
+import logging
+import time
+import weakref
+from collections import defaultdict
+from importlib import import_module
+
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.template.loader import render_to_string
+
+logger = logging.getLogger(__name__)
+
+# user id -> time until which one of their streams is known to be open
+STREAMS_KEY = "live:streams"
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def live_channel(user_id):
+    return f"live:{user_id}"
+
+
+def stream_ttl():
+    # streams are announced again on every heartbeat
+    return 3 * settings.ACTION_STREAM_HEARTBEAT
+
+
+def render_message(action):
+    # an action is rendered once as it looks the same in every feed
+    html = render_to_string("actions/action/detail.html", {"action": action})
+    return json.dumps({"id": action.id, "html": html})
+
+
+def queue_messages(pipe, user_ids, expiries, messages):
+    """
+    Queue the publishing of messages to the users whose expiry in
+    STREAMS_KEY, as returned by ZMSCORE, shows an open stream.
+    """
+    now = time.time()
+    for user_id, expiry in zip(user_ids, expiries):
+        if expiry is not None and expiry > now:
+            for message in messages:
+                pipe.publish(live_channel(user_id), message)
+
+
+class Subscriber:
+    """
+    The pending messages of one stream. A stream that falls behind by
+    more than ACTION_STREAM_QUEUE_SIZE messages is closed instead of
+    buffering without limit, and the browser reloads the page.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(settings.ACTION_STREAM_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Hub:
+    """
+    Share one Redis pub/sub connection between the streams of an event
+    loop, subscribed to the channel of each user with an open stream.
+    """
+
+    def __init__(self):
+        self.client = redis.asyncio.Redis(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+        )
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.subscribers = defaultdict(set)
+        self.reader = None
+        self.announced = 0
+        # keeps the SUBSCRIBE and UNSUBSCRIBE of a channel in order
+        self.lock = asyncio.Lock()
+
+    async def subscribe(self, user_id):
+        subscriber = Subscriber(user_id)
+        channel = live_channel(user_id)
+        async with self.lock:
+            if not self.subscribers[channel]:
+                await self.pubsub.subscribe(channel)
+                await self.announce([user_id])
+            self.subscribers[channel].add(subscriber)
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self.read())
+        return subscriber
+
+    async def unsubscribe(self, subscriber):
+        channel = live_channel(subscriber.user_id)
+        async with self.lock:
+            self.subscribers[channel].discard(subscriber)
+            if not self.subscribers[channel]:
+                del self.subscribers[channel]
+                await self.pubsub.unsubscribe(channel)
+
+    async def announce(self, user_ids):
+        """
+        Record that the users have an open stream for the next stream_ttl()
+        seconds, dropping the expired entries.
+        """
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        if user_ids:
+            pipe.zadd(
+                STREAMS_KEY, {user_id: now + stream_ttl() for user_id in user_ids}
+            )
+        pipe.zremrangebyscore(STREAMS_KEY, "-inf", now)
+        await pipe.execute()
+
+    async def read(self):
+        while self.subscribers:
+            try:
+                if (
+                    time.monotonic() - self.announced
+                    >= settings.ACTION_STREAM_HEARTBEAT
+                ):
+                    self.announced = time.monotonic()
+                    # a channel is empty while its first stream subscribes
+                    await self.announce(
+                        [
+                            next(iter(subscribers)).user_id
+                            for subscribers in self.subscribers.values()
+                            if subscribers
+                        ]
+                    )
+                message = await self.pubsub.get_message(timeout=1.0)
+            except (redis.RedisError, OSError):
+                logger.warning("Lost the live feed connection, reconnecting")
+                await asyncio.sleep(1)
+                await self.reconnect()
+                continue
+            if message is None:
+                continue
+            channel = message["channel"].decode()
+            for subscriber in self.subscribers.get(channel, ()):
+                subscriber.put(message["data"])
+
+    async def reconnect(self):
+        try:
+            await self.pubsub.aclose()
+            self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            if self.subscribers:
+                await self.pubsub.subscribe(*self.subscribers)
+        except (redis.RedisError, OSError):
+            pass
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = Hub()
+    return hub
+
+
+def _authenticate(scope):
+    close_old_connections()
+    try:
+        request = ASGIRequest(scope, io.BytesIO())
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        user = get_user(request)
+        return user.id if user.is_authenticated else None
+    finally:
+        close_old_connections()
+
+
+async def _send_events(send, subscriber):
+    heartbeat = settings.ACTION_STREAM_HEARTBEAT
+    # browsers reconnect after this many milliseconds if the stream ends
+    await send(
+        {"type": "http.response.body", "body": b"retry: 5000\n\n", "more_body": True}
+    )
+    while True:
+        try:
+            message = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+        except asyncio.TimeoutError:
+            # keeps proxies from closing idle streams
+            event = b": ping\n\n"
+        else:
+            event = b"event: action\ndata: " + message + b"\n\n"
+        if subscriber.overflowed:
+            event = b"event: reload\ndata: \n\n"
+        await send({"type": "http.response.body", "body": event, "more_body": True})
+        if subscriber.overflowed:
+            return
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream(scope, receive, send):
+    """
+    ASGI application streaming the new actions of the logged in user's
+    feed.
+
+    Django 4.2 doesn't notice when the client of a streaming response
+    goes away, so the stream is served before reaching Django.
+    """
+    user_id = await sync_to_async(_authenticate)(scope)
+    if user_id is None:
+        # EventSource doesn't retry after an error status
+        await send({"type": "http.response.start", "status": 403, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # nginx would buffer the events otherwise
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    hub = get_hub()
+    subscriber = await hub.subscribe(user_id)
+    tasks = [
+        asyncio.create_task(_send_events(send, subscriber)),
+        asyncio.create_task(_wait_for_disconnect(receive)),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await hub.unsubscribe(subscriber)
+    if tasks[0] in done and tasks[0].exception() is None:
+        # the client was asked to reload, end the response
+        await send({"type": "http.response.body", "body": b""})
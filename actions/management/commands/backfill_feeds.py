@@ -0,0 +1,34 @@
+from account.models import Contact
+from django.core.management.base import BaseCommand
+
+from actions import feed
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis activity feeds of users from the actions table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Only rebuild the feed of this user id (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if not user_ids:
+            user_ids = (
+                Contact.objects.values_list("user_from_id", flat=True)
+                .order_by("user_from_id")
+                .distinct()
+                .iterator()
+            )
+        total = 0
+        for user_id in user_ids:
+            count = feed.rebuild_feed(user_id)
+            total += 1
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Feed of user {user_id}: {count} actions")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} feeds"))
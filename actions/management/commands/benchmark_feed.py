@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+
+from actions.models import Action
+from actions.snapshots import ensure_snapshots
+
+# the loop of the dashboard template
+FEED_TEMPLATE = """
+{% for action in actions %}
+  {% include "actions/action/detail.html" %}
+{% endfor %}
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure queries and time to render pages of the activity feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            action="append",
+            dest="sizes",
+            help="Actions per page (repeatable), defaults to 10, 100 and 1000.",
+        )
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **options):
+        template = engines["django"].from_string(FEED_TEMPLATE)
+        for size in options["sizes"] or [10, 100, 1000]:
+            # the first run fills in missing snapshots and warms up caches
+            self.render_page(template, size)
+            timings = []
+            for _ in range(options["repeat"]):
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    count = self.render_page(template, size)
+                    timings.append(time.perf_counter() - start)
+            self.stdout.write(
+                f"{count} actions: {len(context)} queries, "
+                f"{min(timings) * 1000:.1f} ms"
+            )
+
+    def render_page(self, template, size):
+        actions = ensure_snapshots(list(Action.objects.all()[:size]))
+        template.render({"actions": actions})
+        return len(actions)
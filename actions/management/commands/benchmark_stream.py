@@ -0,0 +1,169 @@
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from actions.feed import r
+from actions.live import live_channel
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many idle live feed streams open against a running ASGI "
+        "server, then measure the delivery of published events."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Base URL, e.g. http://127.0.0.1:8000")
+        parser.add_argument("--clients", type=int, default=10000)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument(
+            "--hold",
+            type=float,
+            default=30,
+            help="Seconds to keep the streams idle before publishing.",
+        )
+        parser.add_argument("--events", type=int, default=20)
+        parser.add_argument(
+            "--connect-concurrency",
+            type=int,
+            default=200,
+            help="Connections opened at the same time.",
+        )
+        parser.add_argument("--pid", type=int, help="Server process to measure.")
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(is_active=True).order_by("id")[: options["users"]]
+        )
+        if not users:
+            raise CommandError("At least one user is needed.")
+        self.sessions = [(user.id, self.create_session(user)) for user in users]
+        asyncio.run(self.run(options))
+
+    def create_session(self, user):
+        # log in by creating the session directly, like Client.force_login
+        store = import_string(f"{settings.SESSION_ENGINE}.SessionStore")()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.save()
+        return store.session_key
+
+    async def run(self, options):
+        url = urlsplit(options["url"])
+        self.published = {}
+        self.latencies = []
+        self.heartbeats = 0
+        self.closed = 0
+        semaphore = asyncio.Semaphore(options["connect_concurrency"])
+        start = time.perf_counter()
+        connections = await asyncio.gather(
+            *(
+                self.connect(url, self.sessions[i % len(self.sessions)], semaphore)
+                for i in range(options["clients"])
+            ),
+            return_exceptions=True,
+        )
+        streams = [stream for stream in connections if isinstance(stream, tuple)]
+        failed = len(connections) - len(streams)
+        self.stdout.write(
+            f"{len(streams)} streams open in {time.perf_counter() - start:.1f}s, "
+            f"{failed} failed"
+        )
+        readers = [asyncio.create_task(self.read(*stream)) for stream in streams]
+        self.report_server(options["pid"])
+        await asyncio.sleep(options["hold"])
+        self.stdout.write(
+            f"After {options['hold']:.0f}s idle: "
+            f"{len(streams) - self.closed} streams open, "
+            f"{self.heartbeats} heartbeats received"
+        )
+        self.report_server(options["pid"])
+
+        # each event goes to one user, so to clients / users streams
+        for event_id in range(options["events"]):
+            user_id, _ = self.sessions[event_id % len(self.sessions)]
+            message = json.dumps({"id": event_id, "html": ""})
+            self.published[event_id] = time.perf_counter()
+            r.publish(live_channel(user_id), message)
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(2)
+        streams_per_user = Counter(
+            i % len(self.sessions)
+            for i, stream in enumerate(connections)
+            if isinstance(stream, tuple)
+        )
+        expected = sum(
+            streams_per_user[event_id % len(self.sessions)]
+            for event_id in range(options["events"])
+        )
+        latencies = sorted(self.latencies)
+        if latencies:
+            self.stdout.write(
+                f"{len(latencies)} of {expected} events delivered, "
+                f"p50 {statistics.median(latencies) * 1000:.0f} ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms"
+            )
+        else:
+            self.stdout.write("No events delivered")
+        for reader in readers:
+            reader.cancel()
+        for _, writer in streams:
+            writer.close()
+
+    async def connect(self, url, session, semaphore):
+        _, session_key = session
+        async with semaphore:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port)
+            writer.write(
+                (
+                    f"GET {reverse('action_stream')} HTTP/1.1\r\n"
+                    f"Host: {url.netloc}\r\n"
+                    f"Cookie: {settings.SESSION_COOKIE_NAME}={session_key}\r\n"
+                    "Accept: text/event-stream\r\n\r\n"
+                ).encode()
+            )
+            headers = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 60)
+            if not headers.startswith(b"HTTP/1.1 200"):
+                writer.close()
+                raise CommandError(headers.split(b"\r\n")[0].decode())
+            return reader, writer
+
+    async def read(self, reader, writer):
+        marker = b'data: {"id": '
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                self.closed += 1
+                return
+            now = time.perf_counter()
+            self.heartbeats += data.count(b": ping")
+            position = data.find(marker)
+            while position >= 0:
+                start = position + len(marker)
+                event_id = int(data[start : data.index(b",", start)])
+                self.latencies.append(now - self.published[event_id])
+                position = data.find(marker, start)
+
+    def report_server(self, pid):
+        if pid is None:
+            return
+        # only needed to measure the server
+        import psutil
+
+        process = psutil.Process(pid)
+        self.stdout.write(
+            f"Server: {process.memory_info().rss / 2**20:.0f} MiB RSS, "
+            f"{process.num_fds()} open files, "
+            f"{process.cpu_percent(interval=1):.0f}% CPU"
+        )
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from actions.partitions import (
+    archive_partition,
+    ensure_partitions,
+    expired_partitions,
+    partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the upcoming monthly partitions of the actions table and "
+        "archive the partitions older than the retention window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead", type=int, default=settings.ACTION_PARTITIONS_AHEAD
+        )
+        parser.add_argument(
+            "--retention",
+            type=int,
+            default=settings.ACTION_RETENTION_MONTHS,
+            help="Months of actions to keep, 0 keeps every partition.",
+        )
+        parser.add_argument("--archive-dir", default=settings.ACTION_ARCHIVE_DIR)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=24 * 60 * 60,
+            help="Seconds between runs.",
+        )
+        parser.add_argument("--once", action="store_true", help="Run only once.")
+
+    def handle(self, *args, **options):
+        while True:
+            self.maintain(options)
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+    def maintain(self, options):
+        for name in ensure_partitions(options["months_ahead"], options["retention"]):
+            self.stdout.write(f"Created partition {name}")
+        if not options["retention"]:
+            return
+        for month in expired_partitions(options["retention"]):
+            path = archive_partition(month, options["archive_dir"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Archived {partition_name(month)} to {path}")
+            )
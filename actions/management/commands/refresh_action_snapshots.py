@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from actions.models import Action
+from actions.snapshots import DIRTY_KEY, dirty_actions, r, refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the feed snapshots of the actions whose user or target "
+        "changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when nothing changed.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when nothing is left to do."
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Refresh every action once, e.g. to backfill existing actions.",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            updated = refresh_snapshots(Action.objects.all(), options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {updated} actions"))
+            return
+        while True:
+            # objects changed during the run stay dirty for the next one
+            markers = [marker.decode() for marker in r.smembers(DIRTY_KEY)]
+            if markers:
+                updated = refresh_snapshots(
+                    dirty_actions(markers), options["batch_size"]
+                )
+                r.srem(DIRTY_KEY, *markers)
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"{len(markers)} objects changed, "
+                        f"refreshed {updated} actions"
+                    )
+            elif options["once"]:
+                break
+            else:
+                time.sleep(options["interval"])
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['user', 'verb', 'target_ct', 'target_id', '-created'], name='actions_act_user_id_43740d_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actions', '0002_action_actions_act_user_id_43740d_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='action',
+            name='snapshot',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='action',
+            index=models.Index(fields=['user', '-created'], name='actions_act_user_id_5d614b_idx'),
+        ),
+    ]
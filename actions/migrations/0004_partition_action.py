@@ -0,0 +1,131 @@
+"""
+Partition the actions table by month on created.
+
+Postgres cannot turn a table into a partitioned one in place. The rows are
+copied into a new partitioned table, which then takes the name, indexes
+and constraints of the old one. The primary key becomes (id, created) as
+every unique constraint of a partitioned table must include the partition
+key; ids still come from a single sequence.
+
+Databases created before Django 4.1 have a serial id column rather than an
+identity one. Its sequence is owned by the old table and only referenced
+by the column default copied to the new table, so it is handed over to
+the new table before the old one is dropped.
+"""
+import datetime
+
+from django.db import migrations
+
+TABLE = "actions_action"
+# months created ahead of the current one, see the manage_action_partitions
+# command for the following ones
+MONTHS_AHEAD = 3
+
+
+def _month(value):
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def _add_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def _rebuild(schema_editor, partitioned):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    new_table = f"{TABLE}_new"
+    with schema_editor.connection.cursor() as cursor:
+        # the definitions are replayed once the new table has the name
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s"
+            " AND indexname <> %s",
+            [TABLE, f"{TABLE}_pkey"],
+        )
+        # indexes of a partitioned table are defined ON ONLY the parent
+        indexes = [
+            definition.replace(" ON ONLY ", " ON ")
+            for definition, in cursor.fetchall()
+        ]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT MIN(created), MAX(id) FROM {TABLE}")
+        oldest, last_id = cursor.fetchone()
+        cursor.execute(
+            "SELECT attidentity <> '' FROM pg_attribute"
+            " WHERE attrelid = %s::regclass AND attname = 'id'",
+            [TABLE],
+        )
+        identity, = cursor.fetchone()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence, = cursor.fetchone()
+
+        options = "PARTITION BY RANGE (created)" if partitioned else ""
+        cursor.execute(
+            f"CREATE TABLE {new_table} (LIKE {TABLE} INCLUDING DEFAULTS"
+            f" INCLUDING CONSTRAINTS INCLUDING IDENTITY) {options}"
+        )
+        if partitioned:
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_default PARTITION OF {new_table} DEFAULT"
+            )
+            now = datetime.datetime.now(datetime.timezone.utc)
+            month = _month(oldest or now)
+            last = _month(now)
+            for _ in range(MONTHS_AHEAD):
+                last = _add_month(last)
+            while month <= last:
+                cursor.execute(
+                    f"CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {new_table}"
+                    " FOR VALUES FROM (%s) TO (%s)",
+                    [month, _add_month(month)],
+                )
+                month = _add_month(month)
+        if not identity:
+            # the serial sequence would be dropped with the old table
+            cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {new_table}.id")
+        cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {TABLE}")
+        # dropping a partitioned table drops its partitions
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"ALTER TABLE {new_table} RENAME TO {TABLE}")
+        if identity:
+            # the new table got its own identity sequence
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+            sequence, = cursor.fetchone()
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {TABLE}_id_seq")
+            sequence = f"{TABLE}_id_seq"
+        primary_key = "id, created" if partitioned else "id"
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey"
+            f" PRIMARY KEY ({primary_key})"
+        )
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        if last_id:
+            cursor.execute("SELECT setval(%s, %s)", [sequence, last_id])
+
+
+def partition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actions', '0003_action_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
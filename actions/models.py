@@ -17,10 +17,16 @@ class Action(models.Model):
     target_id = models.PositiveIntegerField(null=True,
                                             blank=True)
     target = GenericForeignKey('target_ct', 'target_id')
+    # what the activity feed shows of the user and target, see
+    # actions.snapshots
+    snapshot = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         indexes = [
             models.Index(fields=['-created']),
+            models.Index(fields=['user', '-created']),
             models.Index(fields=['target_ct', 'target_id']),
+            models.Index(fields=['user', 'verb', 'target_ct', 'target_id',
+                                 '-created']),
         ]
         ordering = ['-created']
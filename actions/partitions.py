@@ -0,0 +1,136 @@
+"""
+Monthly range partitions of the actions table.
+
+The table is partitioned on created by migration 0004. Partitions are
+named after their month, e.g. actions_action_p202610, and rows outside
+every partition land in actions_action_default.
+"""
+import datetime
+import gzip
+import os
+import re
+
+from django.db import connection, transaction
+
+from .models import Action
+
+PARENT = Action._meta.db_table
+DEFAULT_PARTITION = f"{PARENT}_default"
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def list_partitions():
+    """
+    Return the first day of the month of each partition, oldest first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " WHERE pg_inherits.inhparent = %s::regclass",
+            [PARENT],
+        )
+        names = [name for name, in cursor.fetchall()]
+    pattern = re.compile(rf"^{PARENT}_p(\d{{4}})(\d{{2}})$")
+    months = [
+        datetime.datetime(int(year), int(month), 1, tzinfo=datetime.timezone.utc)
+        for year, month in (
+            match.groups() for match in map(pattern.match, names) if match
+        )
+    ]
+    return sorted(months)
+
+
+def create_partition(month):
+    """
+    Create the partition of a month, moving into it the rows of that month
+    already stored in the default partition.
+    """
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # a partition cannot be created while the default partition holds
+        # rows of its range, so they are moved to a table attached after
+        cursor.execute(
+            f"CREATE TABLE {name}"
+            f" (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION}"
+            " WHERE created >= %s AND created < %s RETURNING *)"
+            f" INSERT INTO {name} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {PARENT} ATTACH PARTITION {name}"
+            " FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+    return name
+
+
+def ensure_partitions(months_ahead, retention_months=0, now=None):
+    """
+    Create the partitions of the current month and of the next months,
+    and of any missing month since the oldest partition still within the
+    retention window. Returns their names.
+    """
+    current = month_start(now or datetime.datetime.now(datetime.timezone.utc))
+    existing = set(list_partitions())
+    month = min(existing, default=current)
+    if retention_months:
+        month = max(month, add_months(current, -retention_months))
+    created = []
+    while month <= add_months(current, months_ahead):
+        if month not in existing:
+            created.append(create_partition(month))
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partition(month, directory):
+    """
+    Write the rows of a partition to a gzipped CSV file, then detach and
+    drop the partition. Returns the path of the file.
+    """
+    name = partition_name(month)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    # the file is complete on disk before anything is dropped
+    with open(f"{path}.tmp", "wb") as file:
+        with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY (SELECT * FROM {name} ORDER BY created) TO STDOUT"
+                    " WITH (FORMAT csv, HEADER)",
+                    archive,
+                )
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(f"{path}.tmp", path)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+    return path
+
+
+def expired_partitions(retention_months, now=None):
+    """
+    Return the months of the partitions entirely older than the retention
+    window.
+    """
+    current = month_start(now or datetime.datetime.now(datetime.timezone.utc))
+    cutoff = add_months(current, -retention_months)
+    return [month for month in list_partitions() if month < cutoff]
@@ -0,0 +1,36 @@
+from account.models import Profile
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from images.models import Image
+from images.thumbnails import thumbnails_generated
+
+from .snapshots import mark_dirty
+
+
+@receiver([post_save, post_delete], sender=Image)
+def image_changed(sender, instance, **kwargs):
+    mark_dirty(Image, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # logging in only updates last_login, which snapshots don't show
+    if update_fields and set(update_fields) == {"last_login"}:
+        return
+    mark_dirty(User, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    mark_dirty(User, instance.user_id)
+
+
+@receiver(thumbnails_generated)
+def thumbnails_changed(sender, pk, **kwargs):
+    if sender is Image:
+        mark_dirty(Image, pk)
+    elif sender is Profile:
+        user_id = Profile.objects.filter(pk=pk).values_list("user_id", flat=True)
+        if user_id:
+            mark_dirty(User, user_id[0])
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q, prefetch_related_objects
+from images.thumbnails import THUMBNAIL_FIELDS, get_stored_thumbnail
+
+from .feed import r
+from .models import Action
+
+# "content type id:object id" of the users and targets changed since the
+# last refresh
+DIRTY_KEY = "snapshots:dirty"
+
+
+def _thumbnail_url(instance):
+    # only precomputed thumbnails, the refresh picks up the others later
+    thumbnail = get_stored_thumbnail(instance, "small", generate=False)
+    return thumbnail["url"] if thumbnail else None
+
+
+def build_snapshot(user, target=None):
+    """
+    Return what the activity feed shows of an action: its author and its
+    target.
+    """
+    profile = getattr(user, "profile", None)
+    # user URLs come from reverse_lazy(), str() makes them serializable
+    snapshot = {
+        "user": {
+            "name": user.first_name,
+            "url": str(user.get_absolute_url()),
+            "photo": _thumbnail_url(profile) if profile else None,
+        }
+    }
+    if target is not None:
+        snapshot["target"] = {
+            "title": str(target),
+            "url": str(target.get_absolute_url()),
+            "thumbnail": (
+                _thumbnail_url(target)
+                if target._meta.label in THUMBNAIL_FIELDS
+                else None
+            ),
+        }
+    return snapshot
+
+
+def mark_dirty(model, pk, client=r):
+    """
+    Refresh the snapshots of the actions of or targeting an object on the
+    next run, once the current transaction commits.
+    """
+    marker = f"{ContentType.objects.get_for_model(model).id}:{pk}"
+    transaction.on_commit(lambda: client.sadd(DIRTY_KEY, marker))
+
+
+def dirty_actions(markers):
+    """
+    Return the actions whose snapshot depends on the marked objects.
+    """
+    object_ids = defaultdict(list)
+    for marker in markers:
+        content_type_id, object_id = marker.split(":")
+        object_ids[int(content_type_id)].append(int(object_id))
+    query = Q(pk__in=[])
+    for content_type_id, ids in object_ids.items():
+        query |= Q(target_ct_id=content_type_id, target_id__in=ids)
+    user_ct = ContentType.objects.get_for_model(User)
+    if user_ct.id in object_ids:
+        query |= Q(user_id__in=object_ids[user_ct.id])
+    return Action.objects.filter(query)
+
+
+def refresh_snapshots(actions, batch_size=1000):
+    """
+    Rebuild the snapshots of a queryset of actions, saving only those that
+    changed. Returns the number of actions updated.
+    """
+    actions = actions.select_related("user__profile").prefetch_related("target")
+    updated = 0
+    changed = []
+    for action in actions.order_by().iterator(chunk_size=batch_size):
+        snapshot = build_snapshot(action.user, action.target)
+        if snapshot != action.snapshot:
+            action.snapshot = snapshot
+            changed.append(action)
+        if len(changed) >= batch_size:
+            updated += Action.objects.bulk_update(changed, ["snapshot"])
+            changed = []
+    if changed:
+        updated += Action.objects.bulk_update(changed, ["snapshot"])
+    return updated
+
+
+def ensure_snapshots(actions):
+    """
+    Fill in the snapshots of actions created before snapshots existed.
+    """
+    missing = [action for action in actions if not action.snapshot]
+    if missing:
+        prefetch_related_objects(missing, "user__profile", "target")
+        for action in missing:
+            action.snapshot = build_snapshot(action.user, action.target)
+        Action.objects.bulk_update(missing, ["snapshot"])
+    return actions
@@ -1,26 +1,151 @@
 import datetime
+import logging
 
+import redis
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.utils import timezone
 
+from . import feed
 from .models import Action
+from .snapshots import build_snapshot
 
+logger = logging.getLogger(__name__)
 
-def create_action(user, verb, target=None):
+# actions repeated within this window are not recorded again
+DEDUP_SECONDS = 60
+
+
+def _target_key(target):
+    if target is None:
+        return None, None
+    # get_for_model is served from the content type cache after first use
+    return ContentType.objects.get_for_model(target).id, target.id
+
+
+def _dedup_key(user_id, verb, target_ct_id, target_id):
+    return f"action:{user_id}:{target_ct_id}:{target_id}:{verb}"
+
+
+def _is_new_action(user, verb, target_ct_id, target_id):
+    if settings.ACTION_DEDUP_REDIS:
+        # the key of an action is set once it is committed, see
+        # _remember_actions()
+        key = _dedup_key(user.id, verb, target_ct_id, target_id)
+        try:
+            return not feed.r.exists(key)
+        except redis.RedisError:
+            logger.warning("Could not check for duplicate actions in Redis")
     # check for any similar action made in the last minute
-    now = timezone.now()
-    last_minute = now - datetime.timedelta(seconds=60)
-    similar_actions = Action.objects.filter(user_id=user.id,
-                                       verb= verb,
-                                       created__gte=last_minute)
-    if target:
-        target_ct = ContentType.objects.get_for_model(target)
+    last_minute = timezone.now() - datetime.timedelta(seconds=DEDUP_SECONDS)
+    similar_actions = Action.objects.filter(
+        user_id=user.id, verb=verb, created__gte=last_minute
+    )
+    if target_ct_id:
         similar_actions = similar_actions.filter(
-                                             target_ct=target_ct,
-                                             target_id=target.id)
-    if not similar_actions:
-        # no existing actions found
-        action = Action(user=user, verb=verb, target=target)
-        action.save()
-        return True
-    return False
+            target_ct_id=target_ct_id, target_id=target_id
+        )
+    return not similar_actions.exists()
+
+
+def _remember_actions(actions):
+    """
+    Mark new actions as recent in Redis once the transaction commits, so
+    an insert that fails or is rolled back never suppresses the action.
+    """
+
+    def remember():
+        pipe = feed.r.pipeline(transaction=False)
+        for action in actions:
+            key = _dedup_key(
+                action.user_id, action.verb, action.target_ct_id, action.target_id
+            )
+            pipe.set(key, 1, nx=True, ex=DEDUP_SECONDS)
+        try:
+            pipe.execute()
+        except redis.RedisError:
+            # duplicates are then only skipped by the database check
+            logger.exception("Could not mark %d new actions", len(actions))
+
+    if settings.ACTION_DEDUP_REDIS and actions:
+        transaction.on_commit(remember)
+
+
+def _fan_out(actions):
+    """
+    Push new actions to the feeds and live streams of their authors'
+    followers once the transaction commits. Feeds are only a cache of the
+    actions table, so a Redis error is logged instead of failing the
+    request, and backfill_feeds repairs the feeds.
+    """
+
+    feeds = settings.ACTIVITY_FEED_ENABLED
+    stream = settings.ACTION_STREAM_ENABLED
+
+    def push():
+        try:
+            feed.push_actions(actions, feeds=feeds, stream=stream)
+        except redis.RedisError:
+            logger.exception("Could not fan out %d new actions", len(actions))
+
+    if actions and (feeds or stream):
+        transaction.on_commit(push)
+
+
+def create_action(user, verb, target=None):
+    target_ct_id, target_id = _target_key(target)
+    if not _is_new_action(user, verb, target_ct_id, target_id):
+        return False
+    action = Action.objects.create(
+        user=user,
+        verb=verb,
+        target_ct_id=target_ct_id,
+        target_id=target_id,
+        snapshot=build_snapshot(user, target),
+    )
+    _remember_actions([action])
+    _fan_out([action])
+    return True
+
+
+def create_actions_bulk(entries):
+    """
+    Record many (user, verb, target) actions with a single duplicate check
+    and a single INSERT. Returns the actions created.
+    """
+    actions = {}
+    for user, verb, target in entries:
+        target_ct_id, target_id = _target_key(target)
+        key = (user.id, verb, target_ct_id, target_id)
+        if key not in actions:
+            actions[key] = Action(
+                user=user,
+                verb=verb,
+                target_ct_id=target_ct_id,
+                target_id=target_id,
+                snapshot=build_snapshot(user, target),
+            )
+    if not actions:
+        return []
+
+    # drop the actions already made in the last minute
+    last_minute = timezone.now() - datetime.timedelta(seconds=DEDUP_SECONDS)
+    recent = set(
+        Action.objects.filter(
+            user_id__in={key[0] for key in actions},
+            verb__in={key[1] for key in actions},
+            created__gte=last_minute,
+        ).values_list("user_id", "verb", "target_ct_id", "target_id")
+    )
+    recent_verbs = {(user_id, verb) for user_id, verb, _, _ in recent}
+    new_actions = [
+        action
+        for key, action in actions.items()
+        if key not in recent and (key[2] is not None or key[:2] not in recent_verbs)
+    ]
+    new_actions = Action.objects.bulk_create(new_actions)
+    # let create_action see these actions as duplicates too
+    _remember_actions(new_actions)
+    _fan_out(new_actions)
+    return new_actions
@@ -1,3 +1,13 @@
-from django.shortcuts import render
+from django.http import HttpResponse
+from django.views import View
 
-# Create your views here.
+
+class ActionStreamView(View):
+    """
+    Live feed of the dashboard. Under ASGI the stream is served by
+    actions.live.stream() before reaching Django; this view only answers
+    when running under WSGI, where 204 tells browsers not to reconnect.
+    """
+
+    def get(self, request):
+        return HttpResponse(status=204)
@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmarks.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once the apps are loaded
+from actions.live import stream  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+STREAM_PATH = reverse('action_stream')
+
+
+async def application(scope, receive, send):
+    # the live feed is streamed outside Django, see actions.live.stream()
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        await stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
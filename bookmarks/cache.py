@@ -0,0 +1,27 @@
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+_pools = {}
+
+
+class SharedPoolRedisCacheClient(RedisCacheClient):
+    def _get_connection_pool(self, write):
+        server = self._servers[self._get_connection_pool_index(write)]
+        if server not in _pools:
+            _pools.setdefault(
+                server, self._pool_class.from_url(server, **self._pool_options)
+            )
+        return _pools[server]
+
+
+class SharedPoolRedisCache(RedisCache):
+    """
+    Redis cache whose connection pools are shared by every instance.
+
+    Cache instances are local to each request under ASGI, and Django's
+    RedisCache never closes its pools, so each request would otherwise
+    leave its connections open.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self._class = SharedPoolRedisCacheClient
@@ -0,0 +1,45 @@
+"""
+Map a function over blocks of a matrix shared with worker processes.
+
+Workers are spawned, so the modules of the mapped functions are imported
+again in every worker: they must not depend on Django, which isn't set
+up there.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+_shared = None
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def get_shared():
+    """
+    Return the data shared with the blocks mapped by map_blocks().
+    """
+    return _shared
+
+
+def map_blocks(function, shared, blocks, *args, workers=1):
+    """
+    Yield the items of the lists returned by function(block, *args) for
+    each block, in order. The function reads shared with get_shared().
+    """
+    if workers <= 1:
+        _init_worker(shared)
+        for block in blocks:
+            yield from function(block, *args)
+        return
+    # shared is sent once to each worker instead of with every block
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(shared,),
+    ) as pool:
+        repeated = [[arg] * len(blocks) for arg in args]
+        for items in pool.map(function, blocks, *repeated):
+            yield from items
@@ -0,0 +1,326 @@
+"""
+Sampled request profiling.
+
+A sample of the requests records the time spent in SQL queries and
+thumbnail generation, and with PROFILING_PATCH_CLASSES in Redis commands
+and template rendering. The timings are sent back in a Server-Timing
+header and added to per view histograms kept in Redis, which the metrics
+view exposes in the Prometheus text format.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis
+import redis.asyncio
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.template.backends.django import Template
+from django.views import View
+
+# connect to redis
+r = redis.Redis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+)
+
+METRICS_KEY = "metrics:views"
+COMPONENTS = ("db", "redis", "template", "thumbnail", "total")
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_profile = ContextVar("profile", default=None)
+_instrumented = False
+# (class, method name) of the methods wrapped by instrument()
+_patched = []
+
+
+def metrics_key(view_name):
+    return f"metrics:view:{view_name}"
+
+
+class Profile:
+    """
+    Calls and seconds spent in each component during a request.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.calls = dict.fromkeys(COMPONENTS, 0)
+        self.seconds = dict.fromkeys(COMPONENTS, 0.0)
+
+    def add(self, component, seconds, calls=1):
+        self.calls[component] += calls
+        self.seconds[component] += seconds
+
+    def finish(self):
+        self.seconds["total"] = time.perf_counter() - self.start
+        self.calls["total"] = 1
+
+    def server_timing(self):
+        metrics = []
+        for component in COMPONENTS:
+            if not self.calls[component]:
+                continue
+            metric = f"{component};dur={self.seconds[component] * 1000:.1f}"
+            if component != "total":
+                metric += f';desc="{self.calls[component]} calls"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+
+@contextmanager
+def timed(component, calls=1):
+    """
+    Add the time spent in the block to a component of the current
+    profile, if the request is sampled.
+    """
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(component, time.perf_counter() - start, calls)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add("db", time.perf_counter() - start)
+
+
+def _install_sql_wrapper(connection, **kwargs):
+    # the wrappers list outlives reconnections of the same connection.
+    # Inserted first as execute_wrapper() pops the last wrapper on exit.
+    if _sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _sql_wrapper)
+
+
+def _wrap_redis(cls, method, calls):
+    original = getattr(cls, method)
+
+    def wrapper(self, *args, **kwargs):
+        profile = _profile.get()
+        if profile is None:
+            return original(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            profile.add("redis", time.perf_counter() - start, calls(self))
+
+    async def async_wrapper(self, *args, **kwargs):
+        profile = _profile.get()
+        if profile is None:
+            return await original(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await original(self, *args, **kwargs)
+        finally:
+            profile.add("redis", time.perf_counter() - start, calls(self))
+
+    wrapped = async_wrapper if iscoroutinefunction(original) else wrapper
+    wrapped.__wrapped__ = original
+    setattr(cls, method, wrapped)
+    _patched.append((cls, method))
+
+
+def _wrap_template(cls):
+    original = cls.render
+
+    def render(self, *args, **kwargs):
+        with timed("template"):
+            return original(self, *args, **kwargs)
+
+    render.__wrapped__ = original
+    cls.render = render
+    _patched.append((cls, "render"))
+
+
+def instrument():
+    """
+    Wrap the database connections and, with PROFILING_PATCH_CLASSES, the
+    Redis client and template classes. Unsampled requests only pay for a
+    context variable lookup.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+    connection_created.connect(_install_sql_wrapper)
+    for connection in connections.all(initialized_only=True):
+        _install_sql_wrapper(connection)
+    if not settings.PROFILING_PATCH_CLASSES:
+        return
+    # every client shares these classes, including the cache and the
+    # clients of other libraries: the patch applies to the whole process
+    for module in (redis, redis.asyncio):
+        _wrap_redis(module.Redis, "execute_command", lambda client: 1)
+        _wrap_redis(
+            module.client.Pipeline,
+            "execute",
+            lambda pipe: max(len(pipe.command_stack), 1),
+        )
+    _wrap_template(Template)
+
+
+def uninstrument():
+    """
+    Undo instrument().
+    """
+    global _instrumented
+    if not _instrumented:
+        return
+    _instrumented = False
+    connection_created.disconnect(_install_sql_wrapper)
+    for connection in connections.all(initialized_only=True):
+        if _sql_wrapper in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_sql_wrapper)
+    while _patched:
+        cls, method = _patched.pop()
+        setattr(cls, method, getattr(cls, method).__wrapped__)
+
+
+def record(view_name, profile, client=r):
+    """
+    Add the timings of a request to the histograms of its view.
+    """
+    pipe = client.pipeline(transaction=False)
+    pipe.sadd(METRICS_KEY, view_name)
+    key = metrics_key(view_name)
+    for component in COMPONENTS:
+        if not profile.calls[component]:
+            continue
+        seconds = profile.seconds[component]
+        bucket = next((str(le) for le in BUCKETS if seconds <= le), "+Inf")
+        pipe.hincrby(key, f"{component}:{bucket}", 1)
+        pipe.hincrbyfloat(key, f"{component}:sum", seconds)
+        pipe.hincrby(key, f"{component}:calls", profile.calls[component])
+    pipe.execute()
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of PROFILING_SAMPLE_RATE of the requests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        if self.sample_rate > 0:
+            instrument()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = Profile()
+        token = _profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.process_response(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        profile = Profile()
+        token = _profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        # the Redis client used to record the metrics is synchronous
+        record_response = sync_to_async(self.process_response)
+        return await record_response(request, response, profile)
+
+    def process_response(self, request, response, profile):
+        profile.finish()
+        response["Server-Timing"] = profile.server_timing()
+        match = request.resolver_match
+        view_name = match.view_name if match else "unmatched"
+        try:
+            record(view_name, profile)
+        except redis.RedisError:
+            pass
+        return response
+
+
+def _format_labels(**labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+class MetricsView(View):
+    """
+    Histograms of the sampled requests of each view in the Prometheus
+    text format, for staff users and INTERNAL_IPS.
+    """
+
+    def get(self, request):
+        if not (
+            request.user.is_staff
+            or request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+        ):
+            raise PermissionDenied
+        return HttpResponse(
+            format_metrics(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+
+def format_metrics(client=r):
+    """
+    Return the histograms of every view in the Prometheus text format.
+    """
+    view_names = sorted(name.decode() for name in client.smembers(METRICS_KEY))
+    pipe = client.pipeline(transaction=False)
+    for view_name in view_names:
+        pipe.hgetall(metrics_key(view_name))
+    lines = [
+        "# HELP bookmarks_request_seconds Time spent per sampled request.",
+        "# TYPE bookmarks_request_seconds histogram",
+    ]
+    calls = [
+        "# HELP bookmarks_request_calls_total Calls made by sampled requests.",
+        "# TYPE bookmarks_request_calls_total counter",
+    ]
+    for view_name, values in zip(view_names, pipe.execute()):
+        values = {field.decode(): value.decode() for field, value in values.items()}
+        for component in COMPONENTS:
+            if f"{component}:sum" not in values:
+                continue
+            cumulative = 0
+            for le in (*map(str, BUCKETS), "+Inf"):
+                cumulative += int(values.get(f"{component}:{le}", 0))
+                labels = _format_labels(view=view_name, component=component, le=le)
+                lines.append(f"bookmarks_request_seconds_bucket{{{labels}}} {cumulative}")
+            labels = _format_labels(view=view_name, component=component)
+            lines.append(
+                f"bookmarks_request_seconds_sum{{{labels}}} {values[f'{component}:sum']}"
+            )
+            lines.append(f"bookmarks_request_seconds_count{{{labels}}} {cumulative}")
+            if component != "total":
+                calls.append(
+                    f"bookmarks_request_calls_total{{{labels}}} "
+                    f"{values[f'{component}:calls']}"
+                )
+    return "\n".join(lines + calls) + "\n"
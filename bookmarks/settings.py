@@ -46,12 +46,11 @@ INSTALLED_APPS = [
     "easy_thumbnails",
     "images.apps.ImagesConfig",
     "actions.apps.ActionsConfig",
-    "debug_toolbar",
     "django.contrib.postgres",
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    "bookmarks.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -61,6 +60,11 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# the debug toolbar is too slow to run outside development
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(1, "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 ROOT_URLCONF = "bookmarks.urls"
 
 TEMPLATES = [
@@ -144,7 +148,15 @@ LOGIN_URL = "login"
 LOGOUT_URL = "logout"
 
 # EMAIL configuration
-EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND")
+# Mail is queued in the outbox table and delivered by the send_queued_mail
+# command through EMAIL_DELIVERY_BACKEND
+EMAIL_BACKEND = "account.outbox.OutboxEmailBackend"
+EMAIL_DELIVERY_BACKEND = os.environ.get(
+    "EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend"
+)
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60  # seconds, doubled after each failed attempt
 EMAIL_HOST = os.environ.get("EMAIL_HOST")
 EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
@@ -156,7 +168,7 @@ MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
 AUTHENTICATION_BACKENDS = [
-    "django.contrib.auth.backends.ModelBackend",
+    "account.authentication.CachedModelBackend",
     "account.authentication.EmailAuthBackend",
 ]
 
@@ -168,10 +180,114 @@ INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
+# Request profiling: share of the requests timed and added to the
+# histograms served at /metrics/, see bookmarks.profiling
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0.01"))
+# Also time Redis commands and template rendering. This wraps methods of
+# the redis-py client and Django template classes for the whole process,
+# so it is off unless asked for.
+PROFILING_PATCH_CLASSES = os.environ.get("PROFILING_PATCH_CLASSES", "0") == "1"
+
 # Redis configuration
 REDIS_HOST = os.environ.get("REDIS_HOST")
 REDIS_PORT = os.environ.get("REDIS_PORT")
 REDIS_DB = os.environ.get("REDIS_DB")
+# Cache and sessions each have their own database, which must differ from
+# REDIS_DB: clearing a cache runs FLUSHDB, which would otherwise log users
+# out and wipe the feeds, counters and queues kept in REDIS_DB.
+REDIS_CACHE_DB = os.environ.get("REDIS_CACHE_DB", "1")
+REDIS_SESSIONS_DB = os.environ.get("REDIS_SESSIONS_DB", "2")
+
+CACHES = {
+    "default": {
+        "BACKEND": "bookmarks.cache.SharedPoolRedisCache",
+        "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_CACHE_DB}",
+        "KEY_PREFIX": "cache",
+    },
+    "sessions": {
+        "BACKEND": "bookmarks.cache.SharedPoolRedisCache",
+        "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_SESSIONS_DB}",
+        "KEY_PREFIX": "session",
+    },
+}
+SESSION_ENGINE = "django.contrib.sessions.backends.cache"
+SESSION_CACHE_ALIAS = "sessions"
+# logged in users and their profile are cached between requests
+USER_CACHE_TIMEOUT = 300  # seconds
+
+# Image view counting: "direct", "pipeline" or "buffered"
+VIEW_COUNTER_MODE = os.environ.get("VIEW_COUNTER_MODE", "pipeline")
+VIEW_COUNTER_FLUSH_INTERVAL = 1000  # ms, buffered mode only
+VIEW_COUNTER_FLUSH_HITS = 100  # buffered mode only
+VIEW_COUNTER_KNOWN_SIZE = 10000  # images whose totals are kept, buffered mode only
+
+# Thumbnails generated when an image or profile photo is saved
+THUMBNAIL_ALIASES = {
+    "images.Image.image": {
+        "list": {"size": (300, 300), "crop": "smart"},
+        "small": {"size": (80, 80), "crop": "100%"},
+        "detail": {"size": (300, 0)},
+    },
+    "account.Profile.photo": {
+        "small": {"size": (80, 80), "crop": "100%"},
+        "profile": {"size": (180, 180)},
+    },
+}
+# processes generating thumbnails, 0 generates them in the request
+THUMBNAIL_WORKERS = 2
+
+# Image ranking
+IMAGE_RANKING_SIZE = 10
+IMAGE_RANKING_MAX_SIZE = 100
+IMAGE_RANKING_CACHE_TIMEOUT = 30  # seconds
+
+# Trending images: interactions add a score that halves every half life
+TRENDING_HALF_LIFE = 6 * 60 * 60  # seconds
+TRENDING_WEIGHTS = {"view": 1, "like": 5, "bookmark": 10}
+TRENDING_MAX_SIZE = 1000  # images kept in the trending zset
+
+# Image list pagination: "cursor" (keyset) or "page" (page numbers)
+IMAGE_LIST_PAGINATION = os.environ.get("IMAGE_LIST_PAGINATION", "cursor")
+
+# Activity feed: actions are pushed to per-follower Redis feeds when created.
+# Set ACTIVITY_FEED_ENABLED=0 to fall back to querying the actions table.
+ACTIVITY_FEED_ENABLED = os.environ.get("ACTIVITY_FEED_ENABLED", "1") == "1"
+ACTIVITY_FEED_LENGTH = 500
+# Push new actions to open dashboards over server-sent events, see
+# actions.live. Requires the ASGI deployment.
+ACTION_STREAM_ENABLED = os.environ.get("ACTION_STREAM_ENABLED", "1") == "1"
+ACTION_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+ACTION_STREAM_QUEUE_SIZE = 100  # events a slow client may lag before a reload
+# Skip duplicate actions with a Redis key set for each committed action
+# instead of a database query
+ACTION_DEDUP_REDIS = os.environ.get("ACTION_DEDUP_REDIS", "1") == "1"
+
+# Actions are partitioned by month, see actions.partitions. Partitions
+# older than the retention window are archived to ACTION_ARCHIVE_DIR and
+# dropped by the manage_action_partitions command. 0 keeps them all.
+ACTION_RETENTION_MONTHS = int(os.environ.get("ACTION_RETENTION_MONTHS", "12"))
+ACTION_PARTITIONS_AHEAD = 3  # months
+ACTION_ARCHIVE_DIR = os.environ.get("ACTION_ARCHIVE_DIR", BASE_DIR / "archive")
+
+# Who to follow: suggestions computed by the compute_suggestions command
+USER_SUGGESTIONS_SIZE = 10
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880 # 5 MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880 # 5 MB
+
+# Remote image fetching used by the bookmarklet
+IMAGE_FETCH_TIMEOUT = (3.05, 10)  # connect, read (seconds)
+IMAGE_FETCH_POOL_SIZE = 10
+# Set IMAGE_FETCH_ASYNC=1 to download images in the fetch_pending_images worker
+IMAGE_FETCH_ASYNC = os.environ.get("IMAGE_FETCH_ASYNC", "0") == "1"
+# Downloaded URLs are revalidated with conditional requests and share the
+# stored file while unchanged, see images.fetch.FetchCache. The least
+# recently used URLs are forgotten past this many bytes of files, 0
+# disables the cache.
+IMAGE_FETCH_CACHE_MAX_BYTES = int(
+    os.environ.get("IMAGE_FETCH_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+)
+# Bookmarked and uploaded images reuse the stored file of a picture whose
+# perceptual hash differs by at most this many bits (up to 3), see
+# images.dedup. 0 only reuses files with the same content.
+IMAGE_DEDUP_DISTANCE = int(os.environ.get("IMAGE_DEDUP_DISTANCE", 3))
@@ -18,15 +18,21 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from actions.views import ActionStreamView
+
+from .profiling import MetricsView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('account.urls')),
     path('account/', include('account.urls')),
     path('images/', include('images.urls', namespace='images')),
-    path('__debug__/', include('debug_toolbar.urls')),
+    path('actions/stream/', ActionStreamView.as_view(), name='action_stream'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
 
 if settings.DEBUG:
+    urlpatterns.append(path('__debug__/', include('debug_toolbar.urls')))
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,407 @@
+import asyncio
+import atexit
+import datetime
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict, defaultdict
+from typing import NamedTuple
+
+import redis
+import redis.asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# connect to redis
+r = redis.Redis(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+)
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """
+    Return the asyncio Redis client of the running event loop. Clients
+    can't be shared between loops, and async views served over WSGI run
+    in a new loop per request.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis.asyncio.Redis(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
+        )
+    return client
+
+
+async def close_async_redis():
+    """
+    Close the asyncio Redis client of the running event loop, for loops
+    that only live for one request.
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+RANKING_KEY = "image_ranking"
+UNIQUE_RANKING_KEY = "image_ranking:unique"
+# per-day viewer HyperLogLogs are kept long enough to build weekly numbers
+DAILY_VIEWERS_TTL = datetime.timedelta(days=8)
+
+# time-window rankings: key suffix format and how long to keep each zset
+RANKING_WINDOWS = {
+    "day": ("%Y%m%d", datetime.timedelta(days=2)),
+    "week": ("%G%V", datetime.timedelta(days=8)),
+}
+
+
+def views_key(image_id):
+    return f"image:{image_id}:views"
+
+
+def views_delta_key(image_id):
+    # views not yet written back to Image.total_views
+    return f"image:{image_id}:views:delta"
+
+
+def viewers_key(image_id, day=None):
+    if day is None:
+        return f"image:{image_id}:viewers"
+    return f"image:{image_id}:viewers:{day.strftime('%Y%m%d')}"
+
+
+def ranking_key(window="all", when=None):
+    if window == "all":
+        return RANKING_KEY
+    if window == "unique":
+        return UNIQUE_RANKING_KEY
+    date_format, _ = RANKING_WINDOWS[window]
+    when = when or timezone.now()
+    return f"{RANKING_KEY}:{window}:{when.strftime(date_format)}"
+
+
+def get_ranking(window="all", limit=10, client=r):
+    """
+    Return the top image ids of a ranking with their scores.
+    """
+    ranking = client.zrevrange(ranking_key(window), 0, limit - 1, withscores=True)
+    # members that aren't image ids, e.g. left by a benchmark, are skipped
+    return [
+        (int(image_id), score) for image_id, score in ranking if image_id.isdigit()
+    ]
+
+
+def unique_viewers(image_id, days=None, client=r):
+    """
+    Return the approximate number of distinct users who viewed an image,
+    either ever or over the last given number of days.
+    """
+    if days is None:
+        return client.pfcount(viewers_key(image_id))
+    today = timezone.now()
+    keys = [
+        viewers_key(image_id, today - datetime.timedelta(days=i))
+        for i in range(days)
+    ]
+    # PFCOUNT of several keys counts their union without storing it
+    return client.pfcount(*keys)
+
+
+# Add viewers to the all-time and daily HyperLogLogs of an image and keep
+# the unique viewers ranking in step. Returns the unique viewer count.
+# KEYS: viewers, daily viewers, unique ranking
+# ARGV: image id, daily ttl, viewer ids...
+RECORD_VIEWERS = """
+local before = redis.call('PFCOUNT', KEYS[1])
+if #ARGV > 2 then
+    redis.call('PFADD', KEYS[1], unpack(ARGV, 3))
+    redis.call('PFADD', KEYS[2], unpack(ARGV, 3))
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+local after = redis.call('PFCOUNT', KEYS[1])
+if after ~= before then
+    redis.call('ZADD', KEYS[3], after, ARGV[1])
+end
+return after
+"""
+
+
+class ViewCount(NamedTuple):
+    views: int
+    viewers: int
+
+
+class ViewCounter:
+    """
+    Count image views in Redis.
+
+    Modes:
+    - "direct": one round trip per command, as views were counted before.
+    - "pipeline": all commands of a view are sent in a single round trip.
+    - "buffered": views are collected in-process and flushed in a single
+      pipeline every flush_interval milliseconds or flush_hits views. View
+      totals returned between flushes are approximate: the last totals of
+      up to known_size images are kept, and the first view of another
+      image reads its totals without flushing. A background thread also
+      flushes views left pending when no more views come in, and the
+      buffer is flushed on exit: a killed worker loses at most the views
+      of the last flush_interval, or flush_hits views.
+
+    Besides the raw view counter, the ids of viewing users are added to a
+    HyperLogLog per image, so refreshes by the same user are only counted
+    once in the unique viewers ranking.
+    """
+
+    MODES = ("direct", "pipeline", "buffered")
+
+    def __init__(
+        self,
+        client=r,
+        mode="pipeline",
+        flush_interval=1000,
+        flush_hits=100,
+        known_size=10000,
+        clock=time.monotonic,
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown view counter mode: {mode}")
+        self.client = client
+        self.mode = mode
+        self.flush_interval = flush_interval / 1000
+        self.flush_hits = flush_hits
+        self.known_size = known_size
+        self.clock = clock
+        self.record_viewers = client.register_script(RECORD_VIEWERS)
+        self._lock = threading.Lock()
+        self._pending = defaultdict(_PendingViews)
+        # last stored totals of the most recently viewed images
+        self._known = OrderedDict()
+        self._hits = 0
+        self._last_flush = clock()
+        self._flusher = None
+        self._closed = threading.Event()
+        if mode == "buffered":
+            atexit.register(self.close)
+
+    def hit(self, image_id, user_id=None):
+        """
+        Record a view of an image and return its total number of views and
+        unique viewers.
+        """
+        viewer_ids = [user_id] if user_id is not None else []
+        if self.mode == "direct":
+            total_views = self.client.incr(views_key(image_id))
+            self.client.incr(views_delta_key(image_id))
+            self.client.zincrby(RANKING_KEY, 1, image_id)
+            for window, (_, ttl) in RANKING_WINDOWS.items():
+                key = ranking_key(window)
+                self.client.zincrby(key, 1, image_id)
+                self.client.expire(key, ttl)
+            total_viewers = self._record_viewers(image_id, viewer_ids)
+            return ViewCount(total_views, total_viewers)
+        if self.mode == "pipeline":
+            pipe = self.client.pipeline(transaction=False)
+            scripted = {}
+            self._queue(pipe, image_id, 1, viewer_ids, scripted)
+            results = self._execute(pipe, scripted)
+            return ViewCount(results[0], results[1])
+        return self._buffer(image_id, viewer_ids)
+
+    async def ahit(self, image_id, user_id=None):
+        """
+        Asyncio version of hit(). Views are always sent in a single
+        pipeline unless they are buffered.
+        """
+        if self.mode == "buffered":
+            return await sync_to_async(self.hit)(image_id, user_id)
+        viewer_ids = [user_id] if user_id is not None else []
+        client = get_async_redis()
+        pipe = client.pipeline(transaction=False)
+        scripted = {}
+        self._queue(pipe, image_id, 1, viewer_ids, scripted)
+        results = await pipe.execute(raise_on_error=False)
+        record_viewers = client.register_script(RECORD_VIEWERS)
+        for position, (keys, args) in scripted.items():
+            if isinstance(results[position], redis.exceptions.NoScriptError):
+                results[position] = await record_viewers(keys=keys, args=args)
+        return ViewCount(*_raise_errors(results)[:2])
+
+    def _viewers_script_args(self, image_id, viewer_ids):
+        keys = [
+            viewers_key(image_id),
+            viewers_key(image_id, timezone.now()),
+            UNIQUE_RANKING_KEY,
+        ]
+        args = [image_id, int(DAILY_VIEWERS_TTL.total_seconds()), *viewer_ids]
+        return keys, args
+
+    def _record_viewers(self, image_id, viewer_ids):
+        keys, args = self._viewers_script_args(image_id, viewer_ids)
+        return self.record_viewers(keys=keys, args=args)
+
+    def _execute(self, pipe, scripted):
+        """
+        Execute a pipeline, running again the script calls Redis didn't
+        have loaded, e.g. after a restart.
+        """
+        results = pipe.execute(raise_on_error=False)
+        for position, (keys, args) in scripted.items():
+            if isinstance(results[position], redis.exceptions.NoScriptError):
+                # the script didn't run, so running it once more is safe
+                results[position] = self.record_viewers(keys=keys, args=args)
+        return _raise_errors(results)
+
+    def _queue(self, pipe, image_id, count, viewer_ids, scripted):
+        # the first two queued commands must return the new total views
+        # and unique viewers
+        pipe.incrby(views_key(image_id), count)
+        # EVALSHA is queued directly: adding the script to the pipeline
+        # would cost a SCRIPT EXISTS round trip on every execute. The
+        # positions and arguments of the calls are kept in scripted.
+        keys, args = self._viewers_script_args(image_id, viewer_ids)
+        scripted[len(pipe)] = (keys, args)
+        pipe.evalsha(self.record_viewers.sha, len(keys), *keys, *args)
+        pipe.incrby(views_delta_key(image_id), count)
+        pipe.zincrby(RANKING_KEY, count, image_id)
+        for window, (_, ttl) in RANKING_WINDOWS.items():
+            key = ranking_key(window)
+            pipe.zincrby(key, count, image_id)
+            pipe.expire(key, ttl)
+        return 4 + 2 * len(RANKING_WINDOWS)
+
+    def _buffer(self, image_id, viewer_ids):
+        self._start_flusher()
+        with self._lock:
+            pending = self._pending[image_id]
+            pending.views += 1
+            pending.viewer_ids.update(viewer_ids)
+            self._hits += 1
+            due = (
+                self._hits >= self.flush_hits
+                or self.clock() - self._last_flush >= self.flush_interval
+            )
+            known = image_id in self._known
+        if due:
+            self.flush()
+        elif not known:
+            self._load(image_id)
+        with self._lock:
+            views, viewers = self._known.get(image_id, (0, 0))
+            if image_id in self._known:
+                self._known.move_to_end(image_id)
+            pending = self._pending.get(image_id)
+            if pending:
+                views += pending.views
+            return ViewCount(views, viewers)
+
+    def _load(self, image_id):
+        # a read, so the pending views of other images stay buffered
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(views_key(image_id))
+        pipe.pfcount(viewers_key(image_id))
+        views, viewers = pipe.execute()
+        with self._lock:
+            # unless a flush stored newer totals meanwhile
+            if image_id not in self._known:
+                self._remember(image_id, ViewCount(int(views or 0), viewers))
+
+    def _remember(self, image_id, count):
+        self._known[image_id] = count
+        self._known.move_to_end(image_id)
+        while len(self._known) > self.known_size:
+            self._known.popitem(last=False)
+
+    def _start_flusher(self):
+        # started by the first view rather than on import, as threads
+        # don't survive forking worker processes
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._closed.is_set():
+                return
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(
+                    target=self._flush_idle, name="view-counter-flush", daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_idle(self):
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                due = (
+                    self._pending
+                    and self.clock() - self._last_flush >= self.flush_interval
+                )
+            if not due:
+                continue
+            try:
+                self.flush()
+            except redis.RedisError:
+                # the views are kept for the next flush
+                logger.warning("Could not flush the buffered views", exc_info=True)
+
+    def close(self):
+        """
+        Stop the background flushes and flush the pending views.
+        """
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(_PendingViews)
+            self._hits = 0
+            self._last_flush = self.clock()
+        if not pending:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        scripted = {}
+        sizes = [
+            self._queue(pipe, image_id, views.views, list(views.viewer_ids), scripted)
+            for image_id, views in pending.items()
+        ]
+        try:
+            results = self._execute(pipe, scripted)
+        except redis.RedisError:
+            # keep the views for the next flush
+            with self._lock:
+                for image_id, views in pending.items():
+                    self._pending[image_id].views += views.views
+                    self._pending[image_id].viewer_ids.update(views.viewer_ids)
+            raise
+        offset = 0
+        with self._lock:
+            for image_id, size in zip(pending, sizes):
+                self._remember(
+                    image_id, ViewCount(results[offset], results[offset + 1])
+                )
+                offset += size
+
+
+def _raise_errors(results):
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+class _PendingViews:
+    def __init__(self):
+        self.views = 0
+        self.viewer_ids = set()
+
+
+view_counter = ViewCounter(
+    mode=settings.VIEW_COUNTER_MODE,
+    flush_interval=settings.VIEW_COUNTER_FLUSH_INTERVAL,
+    flush_hits=settings.VIEW_COUNTER_FLUSH_HITS,
+    known_size=settings.VIEW_COUNTER_KNOWN_SIZE,
+)
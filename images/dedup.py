@@ -0,0 +1,156 @@
+"""
+Reuse the stored file of an image bookmarked or uploaded before.
+
+Each stored file gets a SHA-256 content hash and a 64-bit difference hash
+(dHash) of its pixels. An incoming file with the content hash of a stored
+one, or a difference hash at most IMAGE_DEDUP_DISTANCE bits away, is not
+stored again: the image points to the existing file and its thumbnails.
+
+Near duplicates are found with multi-index hashing. The difference hash is
+split into PHASH_BANDS bands with an expression index each. Two hashes at
+most PHASH_BANDS - 1 bits apart share at least one band, so only the
+images matching a band are compared bit by bit.
+"""
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from PIL import Image as PILImage
+
+from .models import PHASH_BAND_BITS, PHASH_BANDS, Image, phash_band
+
+HASH_SIZE = 8
+HASH_FIELDS = ["content_hash", "perceptual_hash"]
+# hashes of nearly uniform pictures, e.g. blank or single colour images,
+# have almost every bit equal and would match each other
+MIN_BITS = 8
+
+
+def _bands(value):
+    mask = (1 << PHASH_BAND_BITS) - 1
+    return [
+        (value >> (band * PHASH_BAND_BITS)) & mask for band in range(PHASH_BANDS)
+    ]
+
+
+def hamming_distance(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+def content_hash(file):
+    sha = hashlib.sha256()
+    for chunk in file.chunks():
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def perceptual_hash(file):
+    """
+    Return the difference hash of a picture as a signed 64-bit integer, or
+    None if it cannot be decoded: each bit tells whether a pixel of a 9x8
+    grayscale thumbnail is brighter than its right neighbour.
+    """
+    file.seek(0)
+    try:
+        with PILImage.open(file) as picture:
+            # JPEG files are decoded at a reduced scale
+            picture.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+            pixels = np.asarray(
+                picture.convert("L").resize(
+                    (HASH_SIZE + 1, HASH_SIZE), PILImage.Resampling.LANCZOS
+                ),
+                dtype=np.int16,
+            )
+    except (OSError, PILImage.DecompressionBombError):
+        return None
+    finally:
+        file.seek(0)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    # stored in a bigint column
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hash_file(file):
+    """
+    Return the content hash and the perceptual hash of a file.
+    """
+    return content_hash(file), perceptual_hash(file)
+
+
+def find_duplicate(digest, phash, max_distance=None):
+    """
+    Return the stored image with the same content hash, or else the one
+    with the nearest perceptual hash within max_distance bits, or None.
+    """
+    if max_distance is None:
+        max_distance = settings.IMAGE_DEDUP_DISTANCE
+    stored = Image.objects.exclude(image="").order_by("id")
+    duplicate = stored.filter(content_hash=digest).first()
+    if duplicate or phash is None or not max_distance:
+        return duplicate
+    if not MIN_BITS <= hamming_distance(phash, 0) <= 64 - MIN_BITS:
+        return None
+    # the bands only find hashes at most PHASH_BANDS - 1 bits away
+    max_distance = min(max_distance, PHASH_BANDS - 1)
+    query = Q()
+    for band, value in enumerate(_bands(phash)):
+        query |= Q(**{f"band{band}": value})
+    candidates = stored.alias(
+        **{f"band{band}": phash_band(band) for band in range(PHASH_BANDS)}
+    ).filter(query)
+    best = None
+    for candidate in candidates.only("id", "image", "thumbnails", *HASH_FIELDS):
+        distance = hamming_distance(phash, candidate.perceptual_hash)
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, candidate)
+    return best[1] if best else None
+
+
+def store_image(image, name, content):
+    """
+    Set the file of an Image without saving it, reusing the file and the
+    thumbnails of a stored duplicate if there is one. Returns the
+    duplicate or None.
+    """
+    digest, phash = hash_file(content)
+    duplicate = find_duplicate(digest, phash)
+    if duplicate is None:
+        image.image.save(name, content, save=False)
+        image.content_hash, image.perceptual_hash = digest, phash
+        return None
+    share_file(image, duplicate)
+    return duplicate
+
+
+def share_file(image, stored):
+    """
+    Point an Image to the file and thumbnails of a stored one.
+    """
+    image.image = stored.image.name
+    image.content_hash = stored.content_hash
+    image.perceptual_hash = stored.perceptual_hash
+    if stored.thumbnails.get("source") == stored.image.name:
+        # the post_save handler then skips generating them again
+        image.thumbnails = stored.thumbnails
+
+
+def hash_stored_image(pk):
+    """
+    Compute the hashes of the stored file of an image. Returns whether the
+    file could be read.
+    """
+    image = Image.objects.filter(pk=pk).only("pk", "image").first()
+    if image is None or not image.image:
+        return False
+    try:
+        with image.image.open("rb") as file:
+            digest, phash = hash_file(file)
+    except OSError:
+        return False
+    # the filter skips the write if the file was replaced meanwhile
+    Image.objects.filter(pk=pk, image=image.image.name).update(
+        content_hash=digest, perceptual_hash=phash
+    )
+    return True
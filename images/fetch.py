@@ -0,0 +1,276 @@
+import json
+import logging
+import tempfile
+import time
+from hashlib import sha1
+from urllib.parse import urlsplit, urlunsplit
+
+import redis
+import requests
+from django.conf import settings
+from django.core.files import File
+from django.utils.text import slugify
+from requests.adapters import HTTPAdapter
+
+from .counters import r
+from .dedup import find_duplicate, share_file, store_image
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# Store the entry of a URL, then evict the least recently used entries
+# until the files they refer to add up to at most the byte budget.
+# KEYS: entries hash, sizes hash, LRU zset, total bytes, stats hash
+# ARGV: URL key, entry, size, access time, max bytes
+STORE_ENTRY = """
+local previous = redis.call('HGET', KEYS[2], ARGV[1])
+if previous then
+    redis.call('DECRBY', KEYS[4], previous)
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+local total = redis.call('INCRBY', KEYS[4], ARGV[3])
+local evicted = 0
+while total > tonumber(ARGV[5]) do
+    local oldest = redis.call('ZRANGE', KEYS[3], 0, 0)[1]
+    if not oldest then
+        break
+    end
+    total = redis.call('DECRBY', KEYS[4], redis.call('HGET', KEYS[2], oldest) or 0)
+    redis.call('ZREM', KEYS[3], oldest)
+    redis.call('HDEL', KEYS[1], oldest)
+    redis.call('HDEL', KEYS[2], oldest)
+    evicted = evicted + 1
+end
+if evicted > 0 then
+    redis.call('HINCRBY', KEYS[5], 'evictions', evicted)
+end
+return evicted
+"""
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+def create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.IMAGE_FETCH_POOL_SIZE,
+        pool_maxsize=settings.IMAGE_FETCH_POOL_SIZE,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# shared session so connections to the same hosts are reused
+session = create_session()
+
+
+def normalize_url(url):
+    """
+    Return a URL with a lowercase scheme and host, without default port or
+    fragment, so the spellings of a URL share one cache entry.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    userinfo, at, host = parts.netloc.rpartition("@")
+    host = host.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and host.endswith(f":{default_port}"):
+        host = host[: -len(default_port) - 1]
+    return urlunsplit(
+        (scheme, userinfo + at + host, parts.path or "/", parts.query, "")
+    )
+
+
+class FetchCache:
+    """
+    Remember the content hash and the ETag/Last-Modified validators of the
+    downloaded image URLs. A URL downloaded before is revalidated with a
+    conditional GET, and on 304 Not Modified the new image shares the
+    stored file without downloading it again.
+
+    Stored files are never deleted, so max_bytes bounds the files the
+    cache vouches for: once their sizes add up to more, the least recently
+    used URLs are forgotten and downloaded again next time. It defaults to
+    IMAGE_FETCH_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self, client=r, max_bytes=None, key="fetch_cache", clock=time.time):
+        self.client = client
+        self._max_bytes = max_bytes
+        self.keys = [
+            f"{key}:entries",
+            f"{key}:sizes",
+            f"{key}:lru",
+            f"{key}:bytes",
+            f"{key}:stats",
+        ]
+        self.clock = clock
+        self.store_entry = client.register_script(STORE_ENTRY)
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is None:
+            return settings.IMAGE_FETCH_CACHE_MAX_BYTES
+        return self._max_bytes
+
+    def url_key(self, url):
+        return sha1(normalize_url(url).encode()).hexdigest()
+
+    def get(self, url):
+        """
+        Return the entry of a URL and the stored image with its file, or
+        None if the URL isn't cached or its file is gone.
+        """
+        if not self.max_bytes:
+            return None
+        entry = self.client.hget(self.keys[0], self.url_key(url))
+        if entry is None:
+            return None
+        entry = json.loads(entry)
+        stored = find_duplicate(entry["content_hash"], None)
+        if stored is None:
+            return None
+        return entry, stored
+
+    def hit(self, url):
+        """
+        Count a URL revalidated without downloading it again.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(self.keys[2], {self.url_key(url): self.clock()}, xx=True)
+        pipe.hincrby(self.keys[4], "hits")
+        pipe.execute()
+
+    def store(self, url, content_hash, headers, size):
+        """
+        Count a downloaded URL and remember it if the response can be
+        revalidated. Returns the number of entries evicted.
+        """
+        self.client.hincrby(self.keys[4], "misses")
+        validators = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        if not self.max_bytes or not content_hash or not any(validators.values()):
+            return 0
+        entry = json.dumps({"content_hash": content_hash, **validators})
+        return self.store_entry(
+            keys=self.keys,
+            args=[self.url_key(url), entry, size, self.clock(), self.max_bytes],
+        )
+
+    def stats(self):
+        """
+        Return the hits, misses and evictions counted, and the number of
+        entries and bytes cached.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self.keys[4])
+        pipe.zcard(self.keys[2])
+        pipe.get(self.keys[3])
+        counters, entries, size = pipe.execute()
+        stats = {
+            name: int(counters.get(name.encode(), 0))
+            for name in ("hits", "misses", "evictions")
+        }
+        stats.update(entries=entries, bytes=int(size or 0))
+        return stats
+
+    def clear(self):
+        self.client.delete(*self.keys)
+
+
+fetch_cache = FetchCache()
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def fetch(url, max_bytes=None, session=session, headers=None):
+    """
+    Stream a remote file into a temporary file, aborting as soon as it
+    grows past max_bytes. Returns a File positioned at the start and the
+    response headers, or None instead of the File if a conditional request
+    got 304 Not Modified.
+    """
+    if max_bytes is None:
+        max_bytes = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    tmp = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    try:
+        with session.get(
+            url, stream=True, timeout=settings.IMAGE_FETCH_TIMEOUT, headers=headers
+        ) as response:
+            response.raise_for_status()
+            if response.status_code == 304 and headers:
+                tmp.close()
+                return None, response.headers
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise ImageFetchError("The image is too large.")
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ImageFetchError("The image is too large.")
+                tmp.write(chunk)
+    except requests.RequestException as e:
+        tmp.close()
+        raise ImageFetchError("The image could not be downloaded.") from e
+    except ImageFetchError:
+        tmp.close()
+        raise
+    if not size:
+        tmp.close()
+        raise ImageFetchError("The image is empty.")
+    tmp.seek(0)
+    return File(tmp), response.headers
+
+
+def download_image(image, session=session, cache=fetch_cache):
+    """
+    Download image.url into the image field of an Image without saving it,
+    reusing the stored file of a duplicate, or of the same URL if it is
+    cached and hasn't changed.
+    """
+    name = slugify(image.title)
+    extension = image.url.rsplit(".", 1)[1].lower()
+    try:
+        cached = cache.get(image.url)
+    except redis.RedisError:
+        # the image is downloaded again instead
+        logger.warning("Could not read the fetch cache", exc_info=True)
+        cached = None
+    headers = conditional_headers(cached[0]) if cached else None
+    content, response_headers = fetch(image.url, session=session, headers=headers)
+    if content is None:
+        share_file(image, cached[1])
+        _update_cache(cache.hit, image.url)
+        return
+    try:
+        store_image(image, f"{name}.{extension}", content)
+        _update_cache(
+            cache.store, image.url, image.content_hash, response_headers, content.size
+        )
+    finally:
+        content.close()
+
+
+def _update_cache(method, *args):
+    # the image is stored, a cache outage must not fail the bookmark
+    try:
+        method(*args)
+    except redis.RedisError:
+        logger.warning("Could not update the fetch cache", exc_info=True)
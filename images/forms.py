@@ -1,8 +1,8 @@
-import requests
 from django import forms
-from django.core.files.base import ContentFile
-from django.utils.text import slugify
+from django.conf import settings
 
+from .dedup import store_image
+from .fetch import download_image
 from .models import Image
 
 
@@ -26,13 +26,12 @@ class ImageCreateForm(forms.ModelForm):
 
     def save(self, force_insert=False, force_update=False, commit=True):
         image = super().save(commit=False)
-        image_url = self.cleaned_data["url"]
-        name = slugify(image.title)
-        extension = image_url.rsplit(".", 1)[1].lower()
-        image_name = f"{name}.{extension}"
-        # download image from the given URL
-        response = requests.get(image_url)
-        image.image.save(image_name, ContentFile(response.content), save=False)
+        if settings.IMAGE_FETCH_ASYNC:
+            # leave the download to the fetch_pending_images worker
+            image.status = Image.Status.PENDING
+        else:
+            # download image from the given URL
+            download_image(image)
         if commit:
             image.save()
         return image
@@ -43,3 +42,12 @@ class ImageUploadForm(forms.ModelForm):
     class Meta:
         model = Image
         fields = ["title", "description", "image"]
+
+    def save(self, commit=True):
+        image = super().save(commit=False)
+        upload = self.cleaned_data["image"]
+        # store the upload unless the same picture is already stored
+        store_image(image, upload.name, upload)
+        if commit:
+            image.save()
+        return image
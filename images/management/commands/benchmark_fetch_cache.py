@@ -0,0 +1,148 @@
+import hashlib
+import io
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from PIL import Image as PILImage
+
+from images.fetch import FetchCache, create_session, download_image
+from images.models import Image
+
+
+class Origin(BaseHTTPRequestHandler):
+    """
+    Serve generated JPEG files with validators, counting the full and
+    the 304 responses.
+    """
+
+    files = {}
+    # bytes per second sent to each client, 0 for no limit
+    bandwidth = 0
+    responses = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        body = self.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with self.lock:
+            if self.headers.get("If-None-Match") == etag:
+                self.responses["304"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.responses["200"] += 1
+            self.responses["bytes"] += len(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(usegmt=True))
+        self.end_headers()
+        if self.bandwidth:
+            time.sleep(len(body) / self.bandwidth)
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def generate_jpeg(seed, size):
+    generator = random.Random(seed)
+    picture = PILImage.new("RGB", (16, 12))
+    picture.putdata(
+        [tuple(generator.randrange(256) for _ in range(3)) for _ in range(16 * 12)]
+    )
+    buffer = io.BytesIO()
+    picture.resize(size, PILImage.Resampling.BICUBIC).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Bookmark popular URLs of a local HTTP server with and without the "
+        "fetch cache and compare the requests it served."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--urls", type=int, default=20)
+        parser.add_argument("--bookmarks", type=int, default=500)
+        parser.add_argument("--size", type=int, default=1024, help="Image width.")
+        parser.add_argument(
+            "--bandwidth",
+            type=float,
+            default=0,
+            help="Throttle the server to this many MB/s per client.",
+        )
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            default=1024 * 1024 * 1024,
+            help="Byte budget of the cache.",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by("id").first()
+        if user is None:
+            raise CommandError("At least one user is needed.")
+        size = (options["size"], options["size"] * 3 // 4)
+        Origin.files = {
+            f"/{number}.jpg": generate_jpeg(number, size)
+            for number in range(options["urls"])
+        }
+        Origin.bandwidth = options["bandwidth"] * 10**6
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # popular URLs are bookmarked more often
+        generator = random.Random(0)
+        paths = generator.choices(
+            list(Origin.files),
+            weights=[1 / (rank + 1) for rank in range(options["urls"])],
+            k=options["bookmarks"],
+        )
+        urls = [f"http://127.0.0.1:{server.server_port}{path}" for path in paths]
+        try:
+            for max_bytes in (0, options["max_bytes"]):
+                self.run(user, urls, max_bytes)
+        finally:
+            server.shutdown()
+
+    def run(self, user, urls, max_bytes):
+        cache = FetchCache(max_bytes=max_bytes, key="fetch_cache:benchmark")
+        cache.clear()
+        Origin.responses.clear()
+        session = create_session()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ), transaction.atomic():
+            start = time.perf_counter()
+            names = set()
+            for url in urls:
+                image = Image(user=user, title="benchmark", url=url)
+                download_image(image, session=session, cache=cache)
+                image.save()
+                names.add(image.image.name)
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        stats = cache.stats()
+        cache.clear()
+        responses = Origin.responses
+        self.stdout.write(
+            f"{'cache' if max_bytes else 'no cache'}: {len(urls)} bookmarks in "
+            f"{elapsed:.2f}s, origin sent {responses['200']} files "
+            f"({responses['bytes'] / 2**20:.1f} MiB) and {responses['304']} "
+            f"not modified, {len(names)} files stored, {stats['hits']} hits, "
+            f"{stats['misses']} misses, {stats['evictions']} evicted"
+        )
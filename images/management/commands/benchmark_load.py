@@ -0,0 +1,97 @@
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure like and follow throughput of a running server, e.g. to "
+        "compare the WSGI and ASGI deployments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Base URL, e.g. http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--users", type=int, default=20)
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(is_active=True).order_by("id")[: options["users"]]
+        )
+        image = Image.objects.filter(status=Image.Status.READY).first()
+        if len(users) < 2 or image is None:
+            raise CommandError("At least two users and one image are needed.")
+        self.sessions = [self.create_session(user) for user in users]
+        self.local = threading.local()
+        url = options["url"].rstrip("/")
+        # each request likes or unlikes the image, or follows or unfollows
+        # the next user
+        tasks = [
+            self.like_task(url, i, image.id)
+            if i % 2
+            else self.follow_task(url, i, users[(i + 1) % len(users)].id)
+            for i in range(options["requests"])
+        ]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            results = list(pool.map(lambda task: task(), tasks))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for ok, _ in results if not ok)
+        self.stdout.write(
+            f"{len(results) / elapsed:.0f} requests/sec, "
+            f"p50 {statistics.median(latencies) * 1000:.0f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms, "
+            f"{errors} errors"
+        )
+
+    def create_session(self, user):
+        # log in by creating the session directly, like Client.force_login
+        store = import_string(f"{settings.SESSION_ENGINE}.SessionStore")()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.save()
+        return store.session_key
+
+    def post(self, url, i, data):
+        if not hasattr(self.local, "http"):
+            self.local.http = requests.Session()
+        csrf_token = secrets.token_hex(16)
+        start = time.perf_counter()
+        response = self.local.http.post(
+            url,
+            data=data,
+            cookies={
+                settings.SESSION_COOKIE_NAME: self.sessions[i % len(self.sessions)],
+                settings.CSRF_COOKIE_NAME: csrf_token,
+            },
+            headers={"X-CSRFToken": csrf_token, "Referer": url},
+            allow_redirects=False,
+        )
+        ok = response.status_code == 200 and response.json()["status"] == "ok"
+        return ok, time.perf_counter() - start
+
+    def like_task(self, url, i, image_id):
+        action = "like" if i // len(self.sessions) % 2 else "unlike"
+        return lambda: self.post(
+            f"{url}/images/like/", i, {"id": image_id, "action": action}
+        )
+
+    def follow_task(self, url, i, user_id):
+        action = "follow" if i // len(self.sessions) % 2 else "unfollow"
+        return lambda: self.post(
+            f"{url}/account/users/follow/", i, {"id": user_id, "action": action}
+        )
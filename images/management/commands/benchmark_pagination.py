@@ -0,0 +1,103 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+
+from images.models import Image
+from images.pagination import CursorPaginator
+from images.views import ImageListView
+
+
+class Command(BaseCommand):
+    help = (
+        "Time deep pages of the image list with offset and cursor "
+        "pagination on generated images, rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=100000)
+        parser.add_argument(
+            "--page",
+            type=int,
+            action="append",
+            help="Page number to time (repeatable), defaults to 1, 100 and 1000.",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by("id").first()
+        if user is None:
+            raise CommandError("At least one user is needed.")
+        per_page = ImageListView.paginate_by
+        queryset = Image.objects.filter(status=Image.Status.READY)
+        with transaction.atomic():
+            self.seed(user, options["images"])
+            ordered = queryset.order_by("-created", "-id")
+            offset = Paginator(ordered, per_page)
+            cursor = CursorPaginator(queryset, ("-created", "-id"), per_page)
+            for number in options["page"] or [1, 100, 1000]:
+                if number > offset.num_pages:
+                    self.stderr.write(f"There is no page {number}.")
+                    continue
+                next_cursor = None
+                if number > 1:
+                    # the cursor of a page is the last row of the previous one
+                    last = offset.object_list[(number - 1) * per_page - 1]
+                    next_cursor = cursor.encode(last)
+                timings = {
+                    # a new Paginator each time, as each request runs COUNT
+                    "offset": self.time(
+                        lambda: list(Paginator(ordered, per_page).page(number)),
+                        options["repeat"],
+                    ),
+                    "cursor": self.time(
+                        lambda: cursor.page(next_cursor), options["repeat"]
+                    ),
+                }
+                self.stdout.write(
+                    f"page {number:>5}: "
+                    + ", ".join(
+                        f"{name} {timing * 1000:.2f} ms"
+                        for name, timing in timings.items()
+                    )
+                )
+            transaction.set_rollback(True)
+
+    def seed(self, user, count):
+        start = time.perf_counter()
+        images = Image.objects.bulk_create(
+            (
+                Image(
+                    user=user,
+                    title=f"Benchmark {number}",
+                    slug=f"benchmark-{number}",
+                    url=f"https://example.com/benchmark/{number}.jpg",
+                    image=f"benchmark/{number}.jpg",
+                )
+                for number in range(count)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            # created is set on insert: spread the images over 50 a day, so
+            # pages end inside runs of equal dates
+            cursor.execute(
+                "UPDATE images_image "
+                "SET created = CURRENT_DATE - ((id - %s) / 50)::int WHERE id >= %s",
+                [images[0].id, images[0].id],
+            )
+            cursor.execute("ANALYZE images_image")
+        self.stdout.write(
+            f"Generated {count} images in {time.perf_counter() - start:.1f}s"
+        )
+
+    def time(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
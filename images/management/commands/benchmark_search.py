@@ -0,0 +1,104 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from images.models import Image
+from images.views import ImageSearchView
+
+WORDS = (
+    "autumn beach bicycle bridge canyon castle city coffee desert dog "
+    "forest garden harbor island kitchen lake library lighthouse market "
+    "meadow mountain night ocean painting portrait river road snow street "
+    "sunset temple train tree village waterfall window winter"
+).split()
+
+
+def misspell(word, generator):
+    # swap two neighbouring letters, as typed too fast
+    i = generator.randrange(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2 :]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the full-text and the trigram search of ImageSearchView on "
+        "generated images, rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=100000)
+        parser.add_argument("--queries", type=int, default=200)
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by("id").first()
+        if user is None:
+            raise CommandError("At least one user is needed.")
+        generator = random.Random(0)
+        queries = [
+            " ".join(generator.sample(WORDS, generator.choice((1, 2))))
+            for _ in range(options["queries"])
+        ]
+        typos = [
+            misspell(generator.choice(WORDS), generator)
+            for _ in range(options["queries"])
+        ]
+        view = ImageSearchView()
+        with transaction.atomic():
+            self.seed(user, options["images"], generator)
+            self.run("full-text", view.search, queries)
+            self.run("trigram", view.search_similar, typos)
+            transaction.set_rollback(True)
+
+    def seed(self, user, count, generator):
+        start = time.perf_counter()
+        # the search vectors are filled in by the database trigger
+        Image.objects.bulk_create(
+            (
+                Image(
+                    user=user,
+                    title=" ".join(generator.sample(WORDS, 3)).capitalize(),
+                    slug=f"benchmark-{number}",
+                    url=f"https://example.com/benchmark/{number}.jpg",
+                    image=f"benchmark/{number}.jpg",
+                    description=" ".join(generator.choices(WORDS, k=12)),
+                )
+                for number in range(count)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            # the planner needs statistics to use the search indexes
+            cursor.execute("ANALYZE images_image")
+        self.stdout.write(
+            f"Generated {count} images in {time.perf_counter() - start:.1f}s"
+        )
+
+    def run(self, name, search, queries):
+        first, following, results = [], [], 0
+        for query in queries:
+            start = time.perf_counter()
+            page = search(query, None)
+            first.append(time.perf_counter() - start)
+            results += len(page)
+            if page.next_cursor:
+                start = time.perf_counter()
+                search(query, page.next_cursor)
+                following.append(time.perf_counter() - start)
+        self.stdout.write(
+            f"{name:>10}: first page {self.percentiles(first)}, "
+            f"next page {self.percentiles(following)}, "
+            f"{results / len(queries):.1f} results per page"
+        )
+
+    def percentiles(self, timings):
+        if not timings:
+            return "-"
+        timings = sorted(timings)
+        return (
+            f"p50 {statistics.median(timings) * 1000:.1f} ms "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:.1f} ms"
+        )
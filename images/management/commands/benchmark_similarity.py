@@ -0,0 +1,51 @@
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from images.similarity import build_matrix, normalize, top_k_similar
+
+
+class Command(BaseCommand):
+    help = "Time the similar images computation on generated likes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--likes", type=int, default=1000000)
+        parser.add_argument("--users", type=int, default=100000)
+        parser.add_argument("--images", type=int, default=50000)
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--block-size", type=int, default=1000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            action="append",
+            help="Number of processes to compare (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        # popular images get most likes, as in real traffic
+        image_ids = rng.zipf(1.3, options["likes"]) % options["images"]
+        user_ids = rng.integers(0, options["users"], options["likes"])
+        start = time.perf_counter()
+        matrix = normalize(build_matrix(user_ids, image_ids)[0])
+        self.stdout.write(
+            f"Built a {matrix.shape[0]}x{matrix.shape[1]} matrix with "
+            f"{matrix.nnz} likes in {time.perf_counter() - start:.1f}s"
+        )
+        for workers in options["workers"] or [1, os.cpu_count()]:
+            start = time.perf_counter()
+            count = sum(
+                1
+                for _ in top_k_similar(
+                    matrix,
+                    k=options["top"],
+                    block_size=options["block_size"],
+                    workers=workers,
+                )
+            )
+            self.stdout.write(
+                f"{workers:>3} workers: {count} images "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
@@ -0,0 +1,82 @@
+import random
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from images.counters import (
+    RANKING_WINDOWS,
+    UNIQUE_RANKING_KEY,
+    ViewCounter,
+    ranking_key,
+    viewers_key,
+    views_delta_key,
+    views_key,
+)
+
+
+class Command(BaseCommand):
+    help = "Compare view counting throughput of the ViewCounter modes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hits", type=int, default=10000)
+        parser.add_argument("--images", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--db",
+            type=int,
+            help=(
+                "Run against this database of REDIS_HOST, which must not be "
+                "REDIS_DB, instead of an in-process fakeredis."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["db"] is None:
+            try:
+                import fakeredis
+            except ImportError:
+                raise CommandError("fakeredis is not installed, pass --db.")
+            client = fakeredis.FakeRedis()
+        elif options["db"] == int(settings.REDIS_DB):
+            raise CommandError("Don't benchmark against REDIS_DB.")
+        else:
+            client = redis.Redis(
+                host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=options["db"]
+            )
+        # negative ids never clash with images and are skipped by the
+        # write-back
+        image_ids = [
+            -1 - random.randrange(options["images"]) for _ in range(options["hits"])
+        ]
+        try:
+            for mode in ViewCounter.MODES:
+                counter = ViewCounter(client=client, mode=mode)
+                start = time.perf_counter()
+                for image_id in image_ids:
+                    counter.hit(image_id, random.randrange(options["users"]))
+                counter.close()
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{mode:>10}: {len(image_ids) / elapsed:10.0f} views/sec"
+                )
+        finally:
+            self.clean_up(client, set(image_ids))
+
+    def clean_up(self, client, image_ids):
+        # every key and ranking member ViewCounter writes
+        today = timezone.now()
+        pipe = client.pipeline(transaction=False)
+        for image_id in image_ids:
+            pipe.delete(
+                views_key(image_id),
+                views_delta_key(image_id),
+                viewers_key(image_id),
+                viewers_key(image_id, today),
+            )
+        rankings = [ranking_key(window) for window in ("all", *RANKING_WINDOWS)]
+        for key in [*rankings, UNIQUE_RANKING_KEY]:
+            pipe.zrem(key, *image_ids)
+        pipe.execute()
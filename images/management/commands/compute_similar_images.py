@@ -0,0 +1,49 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.recommendations import load_likes, store_similar
+from images.similarity import build_matrix, normalize, top_k_similar
+
+
+class Command(BaseCommand):
+    help = "Compute the images most liked by the users who liked each image."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=1000,
+            help="Images whose similarities are computed at once per worker.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=100000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes, defaults to the number of cores.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        user_ids, image_ids = load_likes(options["chunk_size"])
+        matrix, images = build_matrix(user_ids, image_ids)
+        self.stdout.write(
+            f"Loaded {len(user_ids)} likes of {matrix.shape[0]} users "
+            f"on {matrix.shape[1]} images in {time.perf_counter() - start:.1f}s"
+        )
+        neighbors = top_k_similar(
+            normalize(matrix),
+            k=options["top"],
+            block_size=options["block_size"],
+            workers=options["workers"],
+        )
+        stored = store_similar(neighbors, images)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored similar images of {stored} images "
+                f"in {time.perf_counter() - start:.1f}s"
+            )
+        )
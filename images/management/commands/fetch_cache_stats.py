@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from images.fetch import fetch_cache
+
+
+class Command(BaseCommand):
+    help = "Report the hits and misses of the image fetch cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear", action="store_true", help="Forget every entry and counter."
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            fetch_cache.clear()
+        stats = fetch_cache.stats()
+        requests = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / requests if requests else 0
+        self.stdout.write(
+            f"Hits: {stats['hits']}, misses: {stats['misses']} ({ratio:.1%} hits)"
+        )
+        self.stdout.write(
+            f"Entries: {stats['entries']}, {stats['bytes']} bytes, "
+            f"evicted: {stats['evictions']}"
+        )
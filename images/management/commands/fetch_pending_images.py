@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from images.fetch import ImageFetchError, download_image
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = "Download the files of images bookmarked in background mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when there is nothing to fetch.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_batch(options["batch_size"])
+            if not processed:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+
+    def process_batch(self, batch_size):
+        with transaction.atomic():
+            # skip rows locked by other workers so several can run at once
+            images = list(
+                Image.objects.select_for_update(skip_locked=True)
+                .filter(status=Image.Status.PENDING)
+                .order_by("created")[:batch_size]
+            )
+            for image in images:
+                try:
+                    download_image(image)
+                    image.status = Image.Status.READY
+                except ImageFetchError as e:
+                    image.status = Image.Status.FAILED
+                    self.stderr.write(f"Image {image.id}: {e}")
+                image.save(
+                    update_fields=[
+                        "image",
+                        "status",
+                        "content_hash",
+                        "perceptual_hash",
+                        "thumbnails",
+                    ]
+                )
+        return len(images)
@@ -0,0 +1,61 @@
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import CharField, F, Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Coalesce
+
+from images.thumbnails import THUMBNAIL_FIELDS, create_pool, generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generate the precomputed thumbnails of images and profile photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            choices=list(THUMBNAIL_FIELDS),
+            action="append",
+            dest="models",
+            help="Only process this model (repeatable).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes, defaults to the number of cores.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Regenerate thumbnails that are already up to date.",
+        )
+
+    def handle(self, *args, **options):
+        with create_pool(options["workers"]) as pool:
+            for model_label in options["models"] or THUMBNAIL_FIELDS:
+                model = apps.get_model(model_label)
+                field_name = THUMBNAIL_FIELDS[model_label]
+                queryset = model.objects.exclude(**{field_name: ""})
+                if not options["all"]:
+                    # skip rows whose thumbnails match the current file
+                    queryset = queryset.annotate(
+                        source=Coalesce(
+                            KT("thumbnails__source"), Value(""), output_field=CharField()
+                        )
+                    ).exclude(source=F(field_name))
+                pks = list(queryset.values_list("pk", flat=True))
+                results = pool.map(
+                    generate_thumbnails,
+                    [model_label] * len(pks),
+                    pks,
+                    chunksize=100,
+                )
+                generated = sum(results)
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{model_label}: generated {generated}, "
+                        f"failed {len(pks) - generated}"
+                    )
+                )
@@ -0,0 +1,48 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from images.dedup import hash_stored_image
+from images.models import Image
+from images.thumbnails import create_pool
+
+
+class Command(BaseCommand):
+    help = "Compute the content and perceptual hashes of stored images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes, defaults to the number of cores.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Hash images that already have hashes again.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = Image.objects.exclude(image="")
+        if not options["all"]:
+            queryset = queryset.filter(content_hash="")
+        pks = list(queryset.values_list("pk", flat=True))
+        with create_pool(options["workers"]) as pool:
+            hashed = sum(pool.map(hash_stored_image, pks, chunksize=100))
+        self.stdout.write(
+            self.style.SUCCESS(f"Hashed {hashed}, failed {len(pks) - hashed}")
+        )
+        # files stored before deduplication are left as they are
+        duplicates = (
+            Image.objects.exclude(content_hash="")
+            .values("content_hash")
+            .annotate(files=Count("image", distinct=True))
+            .filter(files__gt=1)
+        )
+        copies = sum(group["files"] - 1 for group in duplicates)
+        if copies:
+            self.stdout.write(
+                f"{copies} stored files duplicate the file of another image"
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = "Repair total_likes of images whose stored count has drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = Image.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        repaired = 0
+        # walk the primary key in ranges so each UPDATE stays short
+        for start in range(0, last_id + 1, batch_size):
+            repaired += Image.objects.filter(
+                id__gte=start, id__lt=start + batch_size
+            ).recount_likes()
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} images"))
@@ -0,0 +1,38 @@
+import redis
+from django.core.management.base import BaseCommand
+
+from images.counters import get_ranking, r, unique_viewers, viewers_key
+
+
+class Command(BaseCommand):
+    help = "Report unique viewers of the most viewed images and their memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="Number of days of daily viewers to merge.",
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        self.stdout.write(
+            f"{'image':>10} {'viewers':>10} {f'{days}d':>10} {'bytes':>10}"
+        )
+        total_bytes = 0
+        for image_id, _ in get_ranking("unique", options["limit"]):
+            # a HyperLogLog takes at most 12 KB, however many viewers it counts
+            try:
+                memory = r.memory_usage(viewers_key(image_id)) or 0
+            except redis.ResponseError:
+                # MEMORY USAGE is not available on every Redis server
+                memory = "-"
+            else:
+                total_bytes += memory
+            self.stdout.write(
+                f"{image_id:>10} {unique_viewers(image_id):>10}"
+                f" {unique_viewers(image_id, days):>10} {memory:>10}"
+            )
+        self.stdout.write(f"Total: {total_bytes} bytes")
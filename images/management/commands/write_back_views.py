@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from images.writeback import import_views, rebuild_counters, write_back_views
+
+
+class Command(BaseCommand):
+    help = "Write the view counts kept in Redis back to Image.total_views."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60.0,
+            help="Seconds to sleep between write-backs.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Write back once and exit."
+        )
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
+            "--import",
+            action="store_true",
+            dest="import_views",
+            help="Seed total_views from the Redis counters.",
+        )
+        mode.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Restore the Redis counters from total_views.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["import_views"]:
+            count = import_views(batch_size)
+            self.stdout.write(f"Imported the views of {count} images.")
+            return
+        if options["rebuild"]:
+            count = rebuild_counters(batch_size)
+            self.stdout.write(f"Rebuilt the counters of {count} images.")
+            return
+        while True:
+            written = write_back_views(batch_size)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Wrote back {written} views.")
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_image_status_image_images_image_pending_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='image',
+            options={'ordering': ['-created', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='images_imag_created_d57897_idx',
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['-created', '-id'], name='images_imag_created_2f5292_idx'),
+        ),
+    ]
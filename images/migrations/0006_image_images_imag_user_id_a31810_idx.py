@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', '-created', '-id'], name='images_imag_user_id_a31810_idx'),
+        ),
+    ]
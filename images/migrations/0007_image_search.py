@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 03:31
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('pg_catalog.english', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('pg_catalog.english', coalesce({row}description, '')), 'B')
+"""
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION images_image_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row="NEW.")};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER images_image_search_vector_trigger
+BEFORE INSERT OR UPDATE OF title, description ON images_image
+FOR EACH ROW EXECUTE FUNCTION images_image_search_vector_update();
+
+UPDATE images_image SET search_vector = {SEARCH_VECTOR.format(row="")};
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER images_image_search_vector_trigger ON images_image;
+DROP FUNCTION images_image_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0006_image_images_imag_user_id_a31810_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='image',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='image',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='images_image_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='images_image_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0007_image_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='total_views',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['-total_views'], name='images_imag_total_v_df67af_idx'),
+        ),
+    ]
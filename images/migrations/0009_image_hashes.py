@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 04:23
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0008_image_total_views'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='perceptual_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(condition=models.Q(('content_hash', ''), _negated=True), fields=['content_hash'], name='images_image_content_hash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('perceptual_hash'), '>>', models.Value(0)), '&', models.Value(65535)), name='images_image_phash_0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('perceptual_hash'), '>>', models.Value(16)), '&', models.Value(65535)), name='images_image_phash_1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('perceptual_hash'), '>>', models.Value(32)), '&', models.Value(65535)), name='images_image_phash_2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('perceptual_hash'), '>>', models.Value(48)), '&', models.Value(65535)), name='images_image_phash_3_idx'),
+        ),
+    ]
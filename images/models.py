@@ -1,10 +1,45 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils.text import slugify
 from django.urls import reverse
 
+# multi-index hashing of Image.perceptual_hash, see images.dedup
+PHASH_BANDS = 4
+PHASH_BAND_BITS = 16
+
+
+def phash_band(band):
+    mask = (1 << PHASH_BAND_BITS) - 1
+    return F("perceptual_hash").bitrightshift(band * PHASH_BAND_BITS).bitand(mask)
+
+
+class ImageQuerySet(models.QuerySet):
+    def recount_likes(self):
+        """
+        Recompute total_likes from the likes table, writing only the
+        images whose stored count has drifted.
+        """
+        likes = (
+            Image.users_like.through.objects.filter(image=OuterRef("pk"))
+            .order_by()
+            .values("image")
+            .annotate(total=Count("*"))
+            .values("total")
+        )
+        total_likes = Coalesce(Subquery(likes), 0)
+        return self.exclude(total_likes=total_likes).update(total_likes=total_likes)
+
 
 class Image(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        READY = "ready", "Ready"
+        FAILED = "failed", "Failed"
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         related_name="images_created",
@@ -20,13 +55,50 @@ class Image(models.Model):
         settings.AUTH_USER_MODEL, related_name="images_liked", blank=True
     )
     total_likes = models.PositiveIntegerField(default=0)
+    # written back periodically from the Redis view counters
+    total_views = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.READY
+    )
+    # precomputed thumbnail URLs and sizes, see images.thumbnails
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
+    # hashes of the stored file, shared by the images bookmarking the same
+    # picture, see images.dedup
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    perceptual_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+    # maintained by a database trigger from title and description
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ImageQuerySet.as_manager()
 
     class Meta:
         indexes = [
-            models.Index(fields=["-created"]),
+            models.Index(fields=["-created", "-id"]),
+            models.Index(fields=["user", "-created", "-id"]),
             models.Index(fields=["-total_likes"]),
+            models.Index(fields=["-total_views"]),
+            models.Index(
+                fields=["created"],
+                condition=models.Q(status="pending"),
+                name="images_image_pending_idx",
+            ),
+            GinIndex(fields=["search_vector"], name="images_image_search_idx"),
+            GinIndex(
+                fields=["title"],
+                opclasses=["gin_trgm_ops"],
+                name="images_image_title_trgm_idx",
+            ),
+            models.Index(
+                fields=["content_hash"],
+                condition=~models.Q(content_hash=""),
+                name="images_image_content_hash_idx",
+            ),
+            *[
+                models.Index(phash_band(band), name=f"images_image_phash_{band}_idx")
+                for band in range(PHASH_BANDS)
+            ],
         ]
-        ordering = ["-created"]
+        ordering = ["-created", "-id"]
 
     def __str__(self):
         return self.title
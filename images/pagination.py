@@ -0,0 +1,84 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CursorPaginator:
+    """
+    Keyset pagination: each page continues after the last row of the
+    previous one, so no COUNT or OFFSET query is needed. The ordering must
+    be unique, e.g. end with the primary key.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset.order_by(*ordering)
+        self.fields = [
+            (field.lstrip("-"), field.startswith("-")) for field in ordering
+        ]
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            values = self.decode(cursor)
+            try:
+                queryset = queryset.filter(self._after(values))
+            except (TypeError, ValueError, ValidationError):
+                # a tampered cursor with values of the wrong type
+                raise InvalidCursor(cursor)
+        # fetch one extra row to know if there is a next page
+        object_list = list(queryset[: self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[: self.per_page]
+            next_cursor = self.encode(object_list[-1])
+        return CursorPage(object_list, next_cursor)
+
+    def encode(self, obj):
+        values = [getattr(obj, name) for name, _ in self.fields]
+        data = json.dumps(values, default=str).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        return values
+
+    def _after(self, values):
+        # (a, b) after (x, y) is a > x OR (a = x AND b > y). The leading
+        # non-strict bound lets the database use a range scan on the index.
+        name, descending = self.fields[0]
+        condition = Q(**{f"{name}__{'lte' if descending else 'gte'}": values[0]})
+        after = Q()
+        for i, (name, descending) in enumerate(self.fields):
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[i]})
+            for j in range(i):
+                step &= Q(**{self.fields[j][0]: values[j]})
+            after |= step
+        return condition & after
@@ -0,0 +1,110 @@
+import numpy as np
+
+from .counters import get_async_redis, r
+from .models import Image
+
+
+def similar_key(image_id):
+    return f"image:{image_id}:similar"
+
+
+def load_likes(chunk_size=100000):
+    """
+    Read the likes table in chunks and return parallel arrays of user
+    and image ids.
+    """
+    Like = Image.users_like.through
+    likes = Like.objects.order_by().values_list("user_id", "image_id")
+    user_ids = []
+    image_ids = []
+    # iterator() streams the rows with a server-side cursor
+    rows = likes.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = np.fromiter(
+            (value for row in _take(rows, chunk_size) for value in row),
+            dtype=np.int64,
+        )
+        if not len(chunk):
+            break
+        user_ids.append(chunk[0::2])
+        image_ids.append(chunk[1::2])
+    if not user_ids:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(user_ids), np.concatenate(image_ids)
+
+
+def _take(rows, count):
+    for _, row in zip(range(count), rows):
+        yield row
+
+
+def replace_zsets(zsets, client=r, batch_size=1000):
+    """
+    Replace the members of zsets from (key, {member: score}) pairs, one
+    batch of keys per round trip. Returns the number of keys written.
+    """
+    written = 0
+    # each batch is written in a transaction so a zset is never seen empty
+    pipe = client.pipeline()
+    for key, scores in zsets:
+        pipe.delete(key)
+        if scores:
+            pipe.zadd(key, scores)
+        written += 1
+        if written % batch_size == 0:
+            pipe.execute()
+    pipe.execute()
+    return written
+
+
+def store_similar(neighbors, image_ids, client=r, batch_size=1000):
+    """
+    Store the similar images of each image in a Redis zset scored by
+    similarity, replacing the previous lists. Returns the number of
+    images stored.
+    """
+    stored = set()
+
+    def similar_zsets():
+        for column, neighbor_columns, scores in neighbors:
+            image_id = int(image_ids[column])
+            stored.add(image_id)
+            yield similar_key(image_id), {
+                int(image_ids[neighbor]): float(score)
+                for neighbor, score in zip(neighbor_columns, scores)
+            }
+
+    replace_zsets(similar_zsets(), client, batch_size)
+    # remove the lists of images that no longer have similar images
+    stale = [
+        key
+        for key in client.scan_iter(match=similar_key("*"), count=batch_size)
+        if int(key.split(b":")[1]) not in stored
+    ]
+    for start in range(0, len(stale), batch_size):
+        client.delete(*stale[start : start + batch_size])
+    return len(stored)
+
+
+def get_similar_images(image_id, limit=6, client=r):
+    """
+    Return the ready images most often liked by the users who liked an
+    image, most similar first.
+    """
+    similar = client.zrevrange(similar_key(image_id), 0, limit - 1)
+    image_ids = [int(id) for id in similar]
+    images = Image.objects.filter(status=Image.Status.READY).in_bulk(image_ids)
+    return [images[id] for id in image_ids if id in images]
+
+
+async def aget_similar_images(image_id, limit=6):
+    """
+    Asyncio version of get_similar_images().
+    """
+    client = get_async_redis()
+    similar = await client.zrevrange(similar_key(image_id), 0, limit - 1)
+    image_ids = [int(id) for id in similar]
+    images = await Image.objects.filter(status=Image.Status.READY).ain_bulk(
+        image_ids
+    )
+    return [images[id] for id in image_ids if id in images]
@@ -1,9 +1,32 @@
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
 from .models import Image
+from .thumbnails import schedule_thumbnails
 
 
 @receiver(m2m_changed, sender=Image.users_like.through)
-def users_like_changed(sender, instance, **kwargs):
-    instance.total_likes = instance.users_like.count()
-    instance.save()
+def users_like_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # likes made through ImageLikeView update total_likes atomically and
+    # never reach this handler; this covers the admin and the shell
+    if reverse and action == "pre_clear":
+        # post_clear has no pk_set, remember the images the user liked
+        instance._cleared_likes = list(
+            sender.objects.filter(user=instance).values_list("image_id", flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # instance is the user, pk_set the liked images
+        if action == "post_clear":
+            pk_set = instance.__dict__.pop("_cleared_likes", None)
+        if pk_set:
+            Image.objects.filter(id__in=pk_set).recount_likes()
+    else:
+        Image.objects.filter(id=instance.id).recount_likes()
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, **kwargs):
+    if instance.image:
+        schedule_thumbnails(instance)
@@ -0,0 +1,70 @@
+"""
+Item-item cosine similarity of images from the users who liked them.
+"""
+import numpy as np
+from scipy import sparse
+
+from bookmarks.parallel import get_shared, map_blocks
+
+
+def build_matrix(user_ids, image_ids):
+    """
+    Build the binary user x image like matrix from parallel arrays of ids
+    and return it with the image id of each column.
+    """
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    images, image_index = np.unique(image_ids, return_inverse=True)
+    data = np.ones(len(user_index), dtype=np.float32)
+    matrix = sparse.csr_matrix(
+        (data, (user_index, image_index)), shape=(len(users), len(images))
+    )
+    # duplicated likes are summed by the constructor
+    matrix.data[:] = 1
+    return matrix, images
+
+
+def normalize(matrix):
+    # scale each image column to unit length so dot products are cosines
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    return (matrix @ sparse.diags(1 / norms).astype(np.float32)).tocsc()
+
+
+def top_k_block(columns, k, min_score=0.0):
+    """
+    Return the k most similar columns of each column in a (start, stop)
+    range as (column, neighbor columns, scores) tuples.
+    """
+    start, stop = columns
+    matrix = get_shared()
+    block = (matrix[:, start:stop].T @ matrix).tocsr()
+    neighbors = []
+    for row in range(block.shape[0]):
+        column = start + row
+        begin, end = block.indptr[row], block.indptr[row + 1]
+        indices = block.indices[begin:end]
+        scores = block.data[begin:end]
+        keep = (indices != column) & (scores > min_score)
+        indices, scores = indices[keep], scores[keep]
+        if not len(indices):
+            continue
+        if len(indices) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            indices, scores = indices[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        neighbors.append((column, indices[order], scores[order]))
+    return neighbors
+
+
+def top_k_similar(matrix, k=10, block_size=1000, workers=1, min_score=0.0):
+    """
+    Yield the k most similar images of each image of a normalized like
+    matrix. Similarities are computed one block of columns at a time, so
+    only block_size rows of the image x image matrix are held in memory
+    per worker.
+    """
+    blocks = [
+        (start, min(start + block_size, matrix.shape[1]))
+        for start in range(0, matrix.shape[1], block_size)
+    ]
+    return map_blocks(top_k_block, matrix, blocks, k, min_score, workers=workers)
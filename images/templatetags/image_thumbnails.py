@@ -0,0 +1,16 @@
+from django import template
+
+from images.thumbnails import get_stored_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag
+def stored_thumbnail(instance, alias):
+    """
+    Usage: {% stored_thumbnail image "list" as im %}
+    Returns the url, width and height of a precomputed thumbnail.
+    """
+    if not instance:
+        return None
+    return get_stored_thumbnail(instance, alias)
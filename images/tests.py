@@ -1,3 +1,824 @@
-from django.test import TestCase
+import base64
+import hashlib
+import datetime
+import html
+import json
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+import redis
+import requests
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+from PIL import Image as PILImage
+
+from .counters import (
+    RANKING_KEY,
+    UNIQUE_RANKING_KEY,
+    ViewCount,
+    ViewCounter,
+    get_ranking,
+    ranking_key,
+    unique_viewers,
+    viewers_key,
+    views_delta_key,
+    views_key,
+)
+from .dedup import find_duplicate, hamming_distance, perceptual_hash, store_image
+from .fetch import FetchCache, ImageFetchError, download_image, fetch
+from .models import Image
+from .pagination import CursorPaginator, InvalidCursor
+from .trending import EPOCH, TrendingEngine
+from .writeback import write_back_views
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+NOW = datetime.datetime(2026, 10, 18, 12, tzinfo=datetime.timezone.utc)
+# standard error of the Redis HyperLogLog is 0.81%
+HLL_ERROR = 0.017
+
+
+def create_images(user, count, title="Image", **fields):
+    """
+    Create ready images with their thumbnails already stored.
+    """
+    thumbnail = {"url": "/media/thumbnail.jpg", "width": 300, "height": 300}
+    return Image.objects.bulk_create(
+        Image(
+            user=user,
+            title=f"{title} {n}",
+            slug=f"{slugify(title)}-{n}",
+            url=f"https://example.com/{n}.jpg",
+            image=f"images/{n}.jpg",
+            thumbnails={"source": f"images/{n}.jpg", "list": thumbnail},
+            **fields,
+        )
+        for n in range(count)
+    )
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class ViewCounterTest(SimpleTestCase):
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        self.now = 0
+        patcher = mock.patch.object(timezone, "now", return_value=NOW)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counter(self, mode, **kwargs):
+        counter = ViewCounter(
+            client=self.client, mode=mode, clock=lambda: self.now, **kwargs
+        )
+        self.addCleanup(counter.close)
+        return counter
+
+    def assertStored(self, image_id, views, viewers):
+        self.assertEqual(int(self.client.get(views_key(image_id))), views)
+        self.assertEqual(int(self.client.get(views_delta_key(image_id))), views)
+        for window in ("all", "day", "week"):
+            self.assertEqual(
+                self.client.zscore(ranking_key(window), image_id), views
+            )
+        self.assertEqual(self.client.zscore(UNIQUE_RANKING_KEY, image_id), viewers)
+        self.assertEqual(unique_viewers(image_id, client=self.client), viewers)
+
+    def assertCounts(self, mode):
+        counter = self.counter(mode)
+        self.assertEqual(counter.hit(1, 10), ViewCount(1, 1))
+        self.assertEqual(counter.hit(1, 20), ViewCount(2, 2))
+        # refreshes and anonymous views only add views
+        self.assertEqual(counter.hit(1, 10), ViewCount(3, 2))
+        self.assertEqual(counter.hit(1), ViewCount(4, 2))
+        self.assertEqual(counter.hit(2), ViewCount(1, 0))
+        self.assertStored(1, views=4, viewers=2)
+        self.assertEqual(self.client.zscore(RANKING_KEY, 2), 1)
+        self.assertIsNone(self.client.zscore(UNIQUE_RANKING_KEY, 2))
+
+    def test_direct(self):
+        self.assertCounts("direct")
+
+    def test_pipeline(self):
+        self.assertCounts("pipeline")
+
+    def test_pipeline_reloads_flushed_script(self):
+        counter = self.counter("pipeline")
+        counter.hit(1, 10)
+        self.client.script_flush()
+        self.assertEqual(counter.hit(1, 20), ViewCount(2, 2))
+        self.assertStored(1, views=2, viewers=2)
+
+    def test_get_ranking(self):
+        counter = self.counter("pipeline")
+        for image_id in (1, 2, 2):
+            counter.hit(image_id)
+        self.client.zadd(RANKING_KEY, {"benchmark-3": 5})
+        self.assertEqual(get_ranking(client=self.client), [(2, 2.0), (1, 1.0)])
+        self.assertEqual(get_ranking("day", limit=1, client=self.client), [(2, 2.0)])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.counter("batched")
+
+    def test_buffered_flushes_after_interval(self):
+        counter = self.counter("buffered", flush_interval=1000, flush_hits=100)
+        for user_id in (10, 20, 10):
+            counter.hit(1, user_id)
+        # pending views are added to the totals returned
+        self.assertEqual(counter.hit(1)[0], 4)
+        self.now += 1
+        self.assertEqual(counter.hit(1, 30), ViewCount(5, 3))
+        self.assertStored(1, views=5, viewers=3)
+
+    def test_buffered_flushes_after_hits(self):
+        counter = self.counter("buffered", flush_interval=1000, flush_hits=5)
+        for image_id in range(5):
+            counter.hit(image_id, 10)
+        for image_id in range(5):
+            self.assertStored(image_id, views=1, viewers=1)
+
+    def test_buffered_flushes_when_idle(self):
+        counter = self.counter("buffered", flush_interval=10, flush_hits=100)
+        counter.hit(1, 10)
+        time.sleep(0.05)
+        self.assertFalse(self.client.exists(views_key(1)))
+        # no more views come in once the interval is over
+        self.now += 1
+        for _ in range(100):
+            if self.client.exists(views_key(1)):
+                break
+            time.sleep(0.01)
+        self.assertStored(1, views=1, viewers=1)
+        counter.close()
+        self.assertFalse(counter._flusher.is_alive())
+
+    def test_buffered_unseen_image_does_not_flush(self):
+        self.counter("pipeline").hit(2, 10)
+        counter = self.counter("buffered", flush_interval=1000, flush_hits=100)
+        counter.hit(1, 10)
+        # the stored totals of another image are read, not flushed over
+        self.assertEqual(counter.hit(2, 20), ViewCount(2, 1))
+        self.assertFalse(self.client.exists(views_key(1)))
+        self.assertEqual(int(self.client.get(views_key(2))), 1)
+        counter.flush()
+        self.assertStored(1, views=1, viewers=1)
+        self.assertStored(2, views=2, viewers=2)
+
+    def test_buffered_known_totals_are_bounded(self):
+        counter = self.counter(
+            "buffered", flush_interval=1000, flush_hits=100, known_size=3
+        )
+        for image_id in range(5):
+            counter.hit(image_id)
+        counter.flush()
+        self.assertEqual(list(counter._known), [2, 3, 4])
+        self.assertEqual(counter.hit(0), ViewCount(2, 0))
+        self.assertEqual(list(counter._known), [3, 4, 0])
+        counter.hit(3)
+        self.assertEqual(list(counter._known), [4, 0, 3])
+
+    def test_buffered_keeps_views_on_error(self):
+        counter = self.counter("buffered", flush_interval=1000, flush_hits=100)
+        counter.hit(1, 10)
+        counter.flush()
+        counter.hit(1, 20)
+        with mock.patch.object(
+            counter, "_execute", side_effect=redis.ConnectionError
+        ), self.assertRaises(redis.ConnectionError):
+            counter.flush()
+        self.assertEqual(int(self.client.get(views_key(1))), 1)
+        counter.flush()
+        self.assertStored(1, views=2, viewers=2)
+
+    def test_unique_viewers_error(self):
+        counter = self.counter("buffered", flush_interval=1000, flush_hits=10**6)
+        for _ in range(2):
+            for user_id in range(5000):
+                counter.hit(1, user_id)
+        counter.flush()
+        self.assertEqual(int(self.client.get(views_key(1))), 10000)
+        for count in (
+            unique_viewers(1, client=self.client),
+            unique_viewers(1, days=1, client=self.client),
+            self.client.zscore(UNIQUE_RANKING_KEY, 1),
+        ):
+            self.assertAlmostEqual(count, 5000, delta=5000 * HLL_ERROR)
+
+    def test_unique_viewers_over_days(self):
+        def seed(days_ago, user_ids):
+            day = NOW - datetime.timedelta(days=days_ago)
+            self.client.pfadd(viewers_key(1, day), *user_ids)
+
+        seed(0, range(0, 3000))
+        seed(1, range(2000, 5000))
+        seed(3, range(10000, 11000))
+        seed(7, range(20000, 21000))
+        for days, expected in ((1, 3000), (2, 5000), (3, 5000), (4, 6000)):
+            with self.subTest(days=days):
+                self.assertAlmostEqual(
+                    unique_viewers(1, days=days, client=self.client),
+                    expected,
+                    delta=expected * HLL_ERROR,
+                )
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class TrendingEngineTest(SimpleTestCase):
+    half_life = 3600
+
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+        self.now = EPOCH + 1000 * self.half_life
+        self.engine = self.trending()
+
+    def trending(self, **kwargs):
+        return TrendingEngine(
+            client=self.client,
+            half_life=self.half_life,
+            weights={"view": 1, "like": 3, "bookmark": 5},
+            clock=lambda: self.now,
+            **kwargs,
+        )
+
+    def assertTop(self, expected, limit=10):
+        top = self.engine.top(limit)
+        self.assertEqual([image_id for image_id, _ in top], [i for i, _ in expected])
+        for (_, score), (_, expected_score) in zip(top, expected):
+            self.assertAlmostEqual(score, expected_score)
+
+    def test_record_returns_score(self):
+        self.assertAlmostEqual(self.engine.record(1, "like"), 3)
+        self.assertAlmostEqual(self.engine.record(1, "bookmark"), 8)
+
+    def test_half_life_decay(self):
+        self.engine.record(1, "bookmark")
+        self.now += self.half_life
+        self.assertTop([(1, 2.5)])
+        self.assertAlmostEqual(self.engine.record(1, "view"), 3.5)
+        self.now += 2 * self.half_life
+        self.assertTop([(1, 3.5 / 4)])
+
+    def test_top_ordering(self):
+        self.engine.record(1, "bookmark")
+        self.engine.record(2, "like")
+        self.engine.record(3, "view")
+        self.assertTop([(1, 5), (2, 3), (3, 1)])
+        # newer interactions outweigh older ones of the same kind
+        self.now += self.half_life
+        self.engine.record(4, "like")
+        self.assertTop([(4, 3), (1, 2.5), (2, 1.5), (3, 0.5)])
+        self.assertTop([(4, 3), (1, 2.5)], limit=2)
+
+    def test_max_size(self):
+        self.engine = self.trending(max_size=3)
+        for image_id in range(1, 6):
+            self.engine.record(image_id, "view")
+            self.now += self.half_life
+        self.assertEqual(self.client.zcard(self.engine.key), 3)
+        self.assertTop([(5, 0.5), (4, 0.25), (3, 0.125)])
+        # an image trimmed away starts over
+        self.engine.record(1, "bookmark")
+        self.assertTop([(1, 5), (5, 0.5), (4, 0.25)])
+
+
+def png_bytes():
+    output = BytesIO()
+    PILImage.linear_gradient("L").resize((64, 64)).save(output, "PNG")
+    return output.getvalue()
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """
+    Serve the responses of FileServer.routes: a status, headers and body,
+    and optionally a delay before the body.
+    """
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        status, headers, body, delay = self.server.routes[self.path]
+        etag = headers.get("ETag")
+        if etag and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            time.sleep(delay)
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FileServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.routes = {}
+        self.requests = []
+
+    def route(self, path, body, status=200, headers=None, delay=0, length=True):
+        headers = dict(headers or {})
+        if length:
+            headers["Content-Length"] = str(len(body))
+        self.routes[path] = (status, headers, body, delay)
+        return f"http://127.0.0.1:{self.server_port}{path}"
+
+
+class FileServerMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FileServer()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.server.routes.clear()
+        self.server.requests.clear()
+
+
+@override_settings(IMAGE_FETCH_TIMEOUT=(1, 0.5))
+class FetchTest(FileServerMixin, SimpleTestCase):
+    def test_fetch(self):
+        url = self.server.route("/a.png", b"picture", headers={"ETag": '"a"'})
+        content, headers = fetch(url)
+        self.assertEqual(content.read(), b"picture")
+        self.assertEqual(headers["ETag"], '"a"')
+        content.close()
+
+    def test_declared_size_cap(self):
+        url = self.server.route("/big.png", b"x" * 2000)
+        with self.assertRaisesMessage(ImageFetchError, "too large"):
+            fetch(url, max_bytes=1000)
+
+    def test_streamed_size_cap(self):
+        # without Content-Length the body is read until the cap
+        url = self.server.route("/big.png", b"x" * 200000, length=False)
+        with self.assertRaisesMessage(ImageFetchError, "too large"):
+            fetch(url, max_bytes=100000)
+
+    def test_size_at_cap(self):
+        url = self.server.route("/a.png", b"x" * 1000)
+        content, _ = fetch(url, max_bytes=1000)
+        self.assertEqual(content.size, 1000)
+        content.close()
+
+    def test_timeout(self):
+        url = self.server.route("/slow.png", b"picture", delay=2)
+        with self.assertRaisesMessage(ImageFetchError, "could not be downloaded") as cm:
+            fetch(url)
+        # a read timeout while streaming the body is a ConnectionError
+        self.assertIsInstance(cm.exception.__cause__, requests.RequestException)
+        self.assertIn("timed out", str(cm.exception.__cause__))
+
+    def test_empty_body(self):
+        url = self.server.route("/empty.png", b"")
+        with self.assertRaisesMessage(ImageFetchError, "empty"):
+            fetch(url)
+
+    def test_client_error(self):
+        for status in (403, 404, 410):
+            with self.subTest(status=status):
+                url = self.server.route("/missing.png", b"Not found", status=status)
+                with self.assertRaisesMessage(
+                    ImageFetchError, "could not be downloaded"
+                ) as cm:
+                    fetch(url)
+                self.assertIsInstance(cm.exception.__cause__, requests.HTTPError)
+
+    def test_unreachable(self):
+        with self.assertRaisesMessage(ImageFetchError, "could not be downloaded"):
+            fetch("http://127.0.0.1:1/a.png")
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+@override_settings(IMAGE_FETCH_TIMEOUT=(1, 0.5))
+class DownloadImageTest(FileServerMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner")
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.cache = FetchCache(client=fakeredis.FakeRedis())
+
+    def image(self, url):
+        return Image(user=self.user, title="A picture", url=url)
+
+    def test_download_image(self):
+        url = self.server.route("/a.png", png_bytes(), headers={"ETag": '"a"'})
+        image = self.image(url)
+        download_image(image, cache=self.cache)
+        self.assertRegex(image.image.name, r"^images/.*/a-picture(_\w+)?\.png$")
+        self.assertEqual(image.image.read(), png_bytes())
+        self.assertEqual(len(image.content_hash), 64)
+        image.save()
+        # the same URL is revalidated instead of downloaded again
+        copy = self.image(url)
+        download_image(copy, cache=self.cache)
+        self.assertEqual(self.server.requests[-1][1]["If-None-Match"], '"a"')
+        self.assertEqual(copy.image.name, image.image.name)
+        self.assertEqual(copy.content_hash, image.content_hash)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_client_error(self):
+        url = self.server.route("/missing.png", b"Not found", status=404)
+        image = self.image(url)
+        with self.assertRaises(ImageFetchError):
+            download_image(image, cache=self.cache)
+        self.assertFalse(image.image)
+
+    def test_cache_evicts_least_recently_used(self):
+        pictures = [picture_bytes(seed) for seed in range(3)]
+        # room for any two of the pictures but not the three
+        self.cache = FetchCache(
+            client=self.cache.client, max_bytes=2 * max(map(len, pictures))
+        )
+        a, b, c = (
+            self.server.route(f"/{name}.png", data, headers={"ETag": f'"{name}"'})
+            for name, data in zip("abc", pictures)
+        )
+        for url in (a, b, a, c):
+            image = self.image(url)
+            download_image(image, cache=self.cache)
+            image.save()
+        stats = self.cache.stats()
+        self.assertEqual(
+            stats,
+            {
+                "hits": 1,
+                "misses": 3,
+                "evictions": 1,
+                "entries": 2,
+                "bytes": len(pictures[0]) + len(pictures[2]),
+            },
+        )
+        # b was used least recently and is downloaded again, evicting a
+        download_image(self.image(b), cache=self.cache)
+        self.assertNotIn("If-None-Match", self.server.requests[-1][1])
+        download_image(self.image(c), cache=self.cache)
+        self.assertEqual(self.server.requests[-1][1]["If-None-Match"], '"c"')
+        self.assertEqual(self.cache.stats()["evictions"], 2)
+
+    def test_cache_needs_validators(self):
+        url = self.server.route("/a.png", png_bytes())
+        for _ in range(2):
+            download_image(self.image(url), cache=self.cache)
+        self.assertNotIn("If-None-Match", self.server.requests[-1][1])
+        self.assertEqual(self.cache.stats()["misses"], 2)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_cache_size_read_from_settings(self):
+        url = self.server.route("/a.png", png_bytes(), headers={"ETag": '"a"'})
+        with override_settings(IMAGE_FETCH_CACHE_MAX_BYTES=0):
+            download_image(self.image(url), cache=self.cache)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        download_image(self.image(url), cache=self.cache)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_cache_outage(self):
+        url = self.server.route("/a.png", png_bytes(), headers={"ETag": '"a"'})
+        image = self.image(url)
+        download_image(image, cache=self.cache)
+        image.save()
+        error = redis.ConnectionError("down")
+        client = self.cache.client
+        for method in ("hget", "hincrby", "pipeline"):
+            self.enterContext(mock.patch.object(client, method, side_effect=error))
+        with self.assertLogs("images.fetch", "WARNING"):
+            copy = self.image(url)
+            download_image(copy, cache=self.cache)
+        # downloaded again, and stored as a duplicate of the first one
+        self.assertNotIn("If-None-Match", self.server.requests[-1][1])
+        self.assertEqual(copy.image.name, image.image.name)
+
+
+class LikesSignalTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("liker")
+        cls.other = User.objects.create_user("other")
+        cls.images = create_images(cls.other, 3)
+
+    def assertLikes(self, *expected):
+        self.assertEqual(
+            [image.total_likes for image in Image.objects.order_by("id")],
+            list(expected),
+        )
+
+    def test_forward_changes(self):
+        image = self.images[0]
+        image.users_like.add(self.user, self.other)
+        self.assertLikes(2, 0, 0)
+        image.users_like.remove(self.other)
+        self.assertLikes(1, 0, 0)
+        image.users_like.clear()
+        self.assertLikes(0, 0, 0)
+
+    def test_reverse_changes(self):
+        self.images[0].users_like.add(self.other)
+        self.user.images_liked.add(*self.images)
+        self.assertLikes(2, 1, 1)
+        self.user.images_liked.remove(self.images[1])
+        self.assertLikes(2, 0, 1)
+        self.user.images_liked.clear()
+        self.assertLikes(1, 0, 0)
+        # nothing is left over for the next clear
+        self.assertFalse(hasattr(self.user, "_cleared_likes"))
+
+
+class ImageSearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("searcher")
+        create_images(cls.user, 20, title="Mountain lake")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_next_page_link(self):
+        url = reverse("images:search")
+        seen = set()
+        response = self.client.get(url, {"q": "mountain"})
+        while True:
+            page = {image.id for image in response.context["images"]}
+            self.assertFalse(page & seen)
+            seen |= page
+            link = re.search(
+                r'href="\?([^"]*)" class="button"', response.content.decode()
+            )
+            if link is None:
+                break
+            query = html.unescape(link[1])
+            # the cursor is base64 and may end with = padding
+            self.assertNotIn("=", re.search("cursor=([^&]*)", query)[1])
+            response = self.client.get(f"{url}?{query}")
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(seen), 20)
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class WriteBackViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner")
+        cls.images = create_images(user, 3, total_views=10)
+
+    def setUp(self):
+        self.client = fakeredis.FakeRedis()
+
+    def assertTotalViews(self, *expected):
+        self.assertEqual(
+            [image.total_views for image in Image.objects.order_by("id")],
+            list(expected),
+        )
+
+    def test_write_back(self):
+        first, second, _ = self.images
+        self.client.set(views_delta_key(first.id), 7)
+        self.client.set(views_delta_key(second.id), 1)
+        self.assertEqual(write_back_views(batch_size=1, client=self.client), 8)
+        self.assertTotalViews(17, 11, 10)
+        self.assertEqual(self.client.keys(views_delta_key("*")), [])
+        self.assertEqual(write_back_views(client=self.client), 0)
+
+    def test_skips_foreign_keys(self):
+        # e.g. left behind by a benchmark
+        self.client.set(views_delta_key("benchmark-3"), 2)
+        self.client.set(views_delta_key(self.images[0].id), 7)
+        self.assertEqual(write_back_views(client=self.client), 7)
+        self.assertTotalViews(17, 10, 10)
+        self.assertEqual(int(self.client.get(views_delta_key("benchmark-3"))), 2)
+
+    def test_gives_deltas_back_on_error(self):
+        self.client.set(views_delta_key(self.images[0].id), 7)
+        with mock.patch(
+            "images.writeback._update_total_views", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            write_back_views(client=self.client)
+        self.assertEqual(int(self.client.get(views_delta_key(self.images[0].id))), 7)
+        self.assertTotalViews(10, 10, 10)
+
+
+@override_settings(IMAGE_LIST_PAGINATION="cursor")
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner")
+        cls.images = create_images(cls.user, 20)
+        # two days with several images each, so ties are broken by id
+        days = [datetime.date(2026, 10, 1), datetime.date(2026, 10, 2)]
+        for n, image in enumerate(cls.images):
+            image.created = days[n % 3 == 0]
+        Image.objects.bulk_update(cls.images, ["created"])
+
+    def paginator(self, per_page=8):
+        return CursorPaginator(Image.objects.all(), ("-created", "-id"), per_page)
+
+    def cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def expected_ids(self):
+        return [
+            image.id
+            for image in sorted(
+                self.images, key=lambda image: (image.created, image.id), reverse=True
+            )
+        ]
+
+    def test_round_trip(self):
+        for per_page in (1, 7, 8, 20, 25):
+            with self.subTest(per_page=per_page):
+                paginator = self.paginator(per_page)
+                ids, cursor = [], None
+                while True:
+                    page = paginator.page(cursor)
+                    self.assertLessEqual(len(page), per_page)
+                    ids += [image.id for image in page]
+                    if not page.has_next():
+                        break
+                    cursor = page.next_cursor
+                self.assertEqual(ids, self.expected_ids())
+
+    def test_cursor_values(self):
+        page = self.paginator().page()
+        last = page.object_list[-1]
+        self.assertEqual(
+            json.loads(base64.urlsafe_b64decode(page.next_cursor)),
+            [last.created.isoformat(), last.id],
+        )
+
+    def test_ties_across_pages(self):
+        # a page ending inside a run of equal dates continues by id
+        expected = self.expected_ids()
+        paginator = self.paginator(3)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        self.assertEqual([image.id for image in second], expected[3:6])
+
+    def test_invalid_cursors(self):
+        paginator = self.paginator()
+        for cursor in (
+            "not base64!",
+            base64.urlsafe_b64encode(b"not json").decode(),
+            base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+            self.cursor({"created": "2026-10-01"}),
+            self.cursor(["2026-10-01"]),
+            self.cursor(["2026-10-01", 1, 2]),
+            # tampered values of the wrong type
+            self.cursor(["2026-10-01", "x"]),
+            self.cursor(["yesterday", 1]),
+            self.cursor([[1], 2]),
+            self.cursor([None, 1]),
+        ):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        url = reverse("images:list")
+        response = self.client.get(url, {"images_only": 1})
+        self.assertEqual(response.status_code, 200)
+        cursor = response["X-Next-Cursor"]
+        response = self.client.get(url, {"images_only": 1, "cursor": cursor})
+        self.assertEqual(
+            [image.id for image in response.context["images"]],
+            self.expected_ids()[8:16],
+        )
+        for cursor in ("garbage", self.cursor(["2026-10-01", "x"])):
+            response = self.client.get(url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+
+
+def picture_bytes(seed, format="PNG", **options):
+    """
+    Return a picture of random coloured blocks, smoothed so re-encoding
+    it hardly changes its difference hash.
+    """
+    generator = random.Random(seed)
+    picture = PILImage.new("RGB", (16, 12))
+    picture.putdata(
+        [tuple(generator.randrange(256) for _ in range(3)) for _ in range(16 * 12)]
+    )
+    output = BytesIO()
+    picture.resize((320, 240), PILImage.Resampling.BICUBIC).save(
+        output, format, **options
+    )
+    return output.getvalue()
+
+
+def blank_bytes(format="PNG", **options):
+    output = BytesIO()
+    PILImage.new("RGB", (320, 240), "white").save(output, format, **options)
+    return output.getvalue()
+
+
+@override_settings(IMAGE_DEDUP_DISTANCE=3)
+class DedupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner")
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def store(self, data, name="picture.png"):
+        """
+        Store a file the way a new bookmark does and return the saved image
+        and the duplicate it reused, if any.
+        """
+        image = Image(user=self.user, title="Picture", url="https://example.com/a")
+        duplicate = store_image(image, name, ContentFile(data))
+        image.save()
+        return image, duplicate
+
+    def test_exact_match(self):
+        original, duplicate = self.store(picture_bytes(1))
+        self.assertIsNone(duplicate)
+        copy, duplicate = self.store(picture_bytes(1))
+        self.assertEqual(duplicate, original)
+        self.assertEqual(copy.image.name, original.image.name)
+        self.assertEqual(copy.content_hash, original.content_hash)
+
+    def test_re_encoded_near_duplicate(self):
+        original, _ = self.store(picture_bytes(2))
+        jpeg = picture_bytes(2, "JPEG", quality=70)
+        distance = hamming_distance(
+            original.perceptual_hash, perceptual_hash(ContentFile(jpeg))
+        )
+        self.assertLessEqual(distance, 3)
+        copy, duplicate = self.store(jpeg, "picture.jpg")
+        self.assertEqual(duplicate, original)
+        self.assertEqual(copy.image.name, original.image.name)
+        # found by its difference hash, not its content hash
+        self.assertNotEqual(hashlib.sha256(jpeg).hexdigest(), original.content_hash)
+
+    def test_different_image(self):
+        original, _ = self.store(picture_bytes(3))
+        other, duplicate = self.store(picture_bytes(4))
+        self.assertIsNone(duplicate)
+        self.assertNotEqual(other.image.name, original.image.name)
+        self.assertGreater(
+            hamming_distance(original.perceptual_hash, other.perceptual_hash), 3
+        )
+
+    def test_blank_image_matches_only_exactly(self):
+        original, _ = self.store(blank_bytes())
+        self.assertEqual(original.perceptual_hash, 0)
+        # every blank picture has the same difference hash
+        other, duplicate = self.store(blank_bytes("JPEG"), "blank.jpg")
+        self.assertIsNone(duplicate)
+        self.assertNotEqual(other.image.name, original.image.name)
+        _, duplicate = self.store(blank_bytes())
+        self.assertEqual(duplicate, original)
+
+    def test_band_lookup(self):
+        """
+        Hashes at most three bits apart share a band with the stored hash,
+        whatever bands the differing bits fall in, including the sign bit.
+        """
+        stored = -0x5A5A_C3C3_0F0F_7E81
+        Image.objects.create(
+            user=self.user,
+            title="Stored",
+            url="https://example.com/stored",
+            image="images/stored.png",
+            content_hash="a" * 64,
+            perceptual_hash=stored,
+        )
+
+        def flip(*bits):
+            value = (stored & ((1 << 64) - 1)) ^ sum(1 << bit for bit in bits)
+            return value - (1 << 64) if value >= 1 << 63 else value
+
+        for bits in ((), (0,), (63,), (5, 21, 63), (15, 16, 47)):
+            with self.subTest(bits=bits):
+                self.assertIsNotNone(find_duplicate("b" * 64, flip(*bits)))
+        for bits in ((5, 21, 37, 63), (0, 1, 2, 3)):
+            with self.subTest(bits=bits):
+                self.assertIsNone(find_duplicate("b" * 64, flip(*bits)))
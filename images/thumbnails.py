@@ -0,0 +1,132 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from bookmarks.profiling import timed
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.exceptions import InvalidImageFormatError
+from easy_thumbnails.files import get_thumbnailer
+
+logger = logging.getLogger(__name__)
+
+# models with precomputed thumbnails and their image field
+THUMBNAIL_FIELDS = {
+    "images.Image": "image",
+    "account.Profile": "photo",
+}
+
+# sent with the model and the pk once the thumbnails of an instance are stored
+thumbnails_generated = Signal()
+
+_pool = None
+
+
+def create_pool(workers):
+    # workers are spawned rather than forked so they never share the
+    # parent's database connections
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    )
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = create_pool(settings.THUMBNAIL_WORKERS)
+    return _pool
+
+
+def build_thumbnails(fieldfile):
+    """
+    Generate every alias configured for a file field and return their
+    URLs and dimensions.
+    """
+    target = f"{fieldfile.instance._meta.label}.{fieldfile.field.name}"
+    thumbnailer = get_thumbnailer(fieldfile)
+    thumbnails = {"source": fieldfile.name}
+    for alias, options in aliases.all(target, include_global=False).items():
+        with timed("thumbnail"):
+            thumbnail = thumbnailer.get_thumbnail(options)
+        thumbnails[alias] = {
+            "url": thumbnail.url,
+            "width": thumbnail.width,
+            "height": thumbnail.height,
+        }
+    return thumbnails
+
+
+def generate_thumbnails(model_label, pk):
+    model = apps.get_model(model_label)
+    field_name = THUMBNAIL_FIELDS[model_label]
+    instance = model.objects.filter(pk=pk).only("pk", field_name).first()
+    if instance is None:
+        return False
+    fieldfile = getattr(instance, field_name)
+    try:
+        thumbnails = build_thumbnails(fieldfile) if fieldfile else {}
+    except (InvalidImageFormatError, OSError):
+        logger.warning("Could not generate thumbnails of %s", fieldfile.name)
+        return False
+    # update() avoids firing post_save again, and the filter skips the
+    # write if the file was replaced while the thumbnails were generated
+    updated = model.objects.filter(pk=pk, **{field_name: fieldfile.name}).update(
+        thumbnails=thumbnails
+    )
+    if updated:
+        thumbnails_generated.send(sender=model, pk=pk)
+    return True
+
+
+def _log_failure(future):
+    if future.exception():
+        logger.error("Thumbnail generation failed", exc_info=future.exception())
+
+
+def schedule_thumbnails(instance):
+    """
+    Generate the thumbnails of an instance once the current transaction
+    commits, unless they are up to date.
+    """
+    model_label = instance._meta.label
+    fieldfile = getattr(instance, THUMBNAIL_FIELDS[model_label])
+    if instance.thumbnails.get("source", "") == fieldfile.name:
+        return
+
+    def submit():
+        if not settings.THUMBNAIL_WORKERS:
+            generate_thumbnails(model_label, instance.pk)
+            return
+        future = get_pool().submit(generate_thumbnails, model_label, instance.pk)
+        future.add_done_callback(_log_failure)
+
+    transaction.on_commit(submit)
+
+
+def get_stored_thumbnail(instance, alias, generate=True):
+    """
+    Return the url, width and height of a thumbnail alias, generating it
+    in-process only if it has not been precomputed yet and generate is
+    true.
+    """
+    fieldfile = getattr(instance, THUMBNAIL_FIELDS[instance._meta.label])
+    if not fieldfile:
+        return None
+    thumbnails = instance.thumbnails
+    if thumbnails.get("source") == fieldfile.name and alias in thumbnails:
+        return thumbnails[alias]
+    if not generate:
+        return None
+    try:
+        with timed("thumbnail"):
+            thumbnail = get_thumbnailer(fieldfile)[alias]
+    except (InvalidImageFormatError, OSError):
+        logger.warning("Could not generate thumbnail of %s", fieldfile.name)
+        return None
+    return {"url": thumbnail.url, "width": thumbnail.width, "height": thumbnail.height}
@@ -0,0 +1,95 @@
+import math
+import time
+
+from django.conf import settings
+
+from .counters import get_async_redis, r
+
+TRENDING_KEY = "image_trending"
+# scores are stored relative to a fixed epoch so they stay comparable
+EPOCH = 1640995200  # 2022-01-01 UTC
+
+# Add an interaction to the trending score of an image and trim the zset.
+# Scores are kept as log(sum(weight * 2 ** ((t - epoch) / half_life))), so
+# adding an interaction is a log-sum-exp and older interactions decay
+# relative to newer ones without ever rescanning the zset.
+# KEYS: trending zset
+# ARGV: image id, log of the decayed weight, max size
+RECORD_INTERACTION = """
+local score = tonumber(ARGV[2])
+local current = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if current then
+    current = tonumber(current)
+    local high = math.max(current, score)
+    score = high + math.log(1 + math.exp(math.min(current, score) - high))
+end
+redis.call('ZADD', KEYS[1], score, ARGV[1])
+local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[3])
+if excess > 0 then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, excess - 1)
+end
+return string.format('%.17g', score)
+"""
+
+
+class TrendingEngine:
+    """
+    Rank images by interactions whose weight halves every half_life
+    seconds. Reading the top images is a single ZREVRANGE.
+    """
+
+    def __init__(
+        self,
+        client=r,
+        half_life=settings.TRENDING_HALF_LIFE,
+        weights=settings.TRENDING_WEIGHTS,
+        max_size=settings.TRENDING_MAX_SIZE,
+        key=TRENDING_KEY,
+        clock=time.time,
+    ):
+        self.client = client
+        self.rate = math.log(2) / half_life
+        self.weights = weights
+        self.max_size = max_size
+        self.key = key
+        self.clock = clock
+        self.record_interaction = client.register_script(RECORD_INTERACTION)
+
+    def log_weight(self, event):
+        return math.log(self.weights[event]) + self.rate * (self.clock() - EPOCH)
+
+    def record(self, image_id, event):
+        """
+        Add a "view", "like" or "bookmark" to the score of an image and
+        return its current trending score.
+        """
+        score = self.record_interaction(
+            keys=[self.key],
+            args=[image_id, repr(self.log_weight(event)), self.max_size],
+        )
+        return self.decay(float(score))
+
+    async def arecord(self, image_id, event):
+        """
+        Asyncio version of record().
+        """
+        record_interaction = get_async_redis().register_script(RECORD_INTERACTION)
+        score = await record_interaction(
+            keys=[self.key],
+            args=[image_id, repr(self.log_weight(event)), self.max_size],
+        )
+        return self.decay(float(score))
+
+    def decay(self, score):
+        # the decayed sum of weights at the current time
+        return math.exp(score - self.rate * (self.clock() - EPOCH))
+
+    def top(self, limit=10):
+        """
+        Return the ids of the top trending images with their current score.
+        """
+        trending = self.client.zrevrange(self.key, 0, limit - 1, withscores=True)
+        return [(int(image_id), self.decay(score)) for image_id, score in trending]
+
+
+trending = TrendingEngine()
@@ -14,4 +14,6 @@ urlpatterns = [
     ),
     path("like/", views.ImageLikeView.as_view(), name="like"),
     path("ranking/", views.ImageRankingView.as_view(), name="ranking"),
+    path("trending/", views.ImageTrendingView.as_view(), name="trending"),
+    path("search/", views.ImageSearchView.as_view(), name="search"),
 ]
@@ -1,4 +1,9 @@
+from hashlib import md5
+
 import redis
+from asgiref.sync import sync_to_async
+
+from account.mixins import AsyncLoginRequiredMixin
 from actions.models import Action
 from actions.utils import create_action
 from django.conf import settings
@@ -6,26 +11,34 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.core.cache import cache
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
-from django.utils.decorators import method_decorator
+from django.db import transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.views import View
-from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, DetailView, ListView, TemplateView
 
+from .counters import RANKING_WINDOWS, get_ranking, view_counter
+from .fetch import ImageFetchError
 from .forms import ImageCreateForm, ImageUploadForm
 from .models import Image
-
-# connect to redis
-r = redis.Redis(
-    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
-)
+from .pagination import CursorPaginator, InvalidCursor
+from .recommendations import aget_similar_images
+from .trending import trending
 
 
 class ImageCreateView(LoginRequiredMixin, CreateView):
     form_class = ImageCreateForm
-    template_name = "image/image/create.html"
+    template_name = "images/image/create.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -33,12 +46,19 @@ class ImageCreateView(LoginRequiredMixin, CreateView):
         return context
 
     def form_valid(self, form):
-        cd = form.cleaned_data
-        new_image = form.save(commit=False)
+        try:
+            new_image = form.save(commit=False)
+        except ImageFetchError as e:
+            form.add_error("url", str(e))
+            return self.form_invalid(form)
         new_image.user = self.request.user
         new_image.save()
         create_action(self.request.user, "bookmarked image", new_image)
-        messages.success(self.request, "Image added successfully")
+        trending.record(new_image.id, "bookmark")
+        if new_image.status == Image.Status.PENDING:
+            messages.success(self.request, "Image added, it will appear shortly")
+        else:
+            messages.success(self.request, "Image added successfully")
         return redirect(new_image.get_absolute_url())
 
 
@@ -57,59 +77,85 @@ class ImageUploadView(LoginRequiredMixin, CreateView):
         new_image.user = self.request.user
         new_image.save()
         create_action(self.request.user, "bookmarked image", new_image)
+        trending.record(new_image.id, "bookmark")
         messages.success(self.request, "Image added successfully")
         return redirect(new_image.get_absolute_url())
 
 
-class ImageDetailView(LoginRequiredMixin, DetailView):
+class ImageDetailView(AsyncLoginRequiredMixin, DetailView):
     model = Image
     template_name = "images/image/detail.html"
     context_object_name = "image"
     slug_field = "slug"
     slug_url_kwarg = "slug"
 
-    def get_object(self):
-        obj = get_object_or_404(
-            Image, id=self.kwargs.get("id"), slug=self.kwargs.get("slug")
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await Image.objects.aget(
+                id=self.kwargs.get("id"), slug=self.kwargs.get("slug")
+            )
+        except Image.DoesNotExist:
+            raise Http404("No image found matching the query")
+        views = await view_counter.ahit(self.object.id, request.user.id)
+        await trending.arecord(self.object.id, "view")
+        context = self.get_context_data(
+            object=self.object,
+            total_views=views.views,
+            unique_viewers=views.viewers,
+            similar_images=await aget_similar_images(self.object.id),
+            section="images",
         )
-        return obj
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        image = self.get_object()
-        total_views = r.incr(f"image:{image.id}:views")
-        r.zincrby("image_ranking", 1, image.id)
-        context["total_views"] = total_views
-        context["section"] = "images"
-        return context
+        # the response is rendered outside the event loop
+        return self.render_to_response(context)
 
 
-@method_decorator(require_POST, name="dispatch")
-class ImageLikeView(LoginRequiredMixin, View):
-    def post(self, request, *args, **kwargs):
+class ImageLikeView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, *args, **kwargs):
         image_id = request.POST.get("id")
         action = request.POST.get("action")
         if image_id and action:
             try:
-                image = Image.objects.get(id=image_id)
+                image = await Image.objects.aget(id=image_id)
                 if action == "like":
-                    image.users_like.add(request.user)
-                    create_action(request.user, "likes", image)
+                    if await sync_to_async(self.like)(image, request.user):
+                        await trending.arecord(image.id, "like")
+                    await sync_to_async(create_action)(request.user, "likes", image)
                 else:
-                    image.users_like.remove(request.user)
-                    content_type = ContentType.objects.get_for_model(image)
-                    Action.objects.filter(
+                    await sync_to_async(self.unlike)(image, request.user)
+                    content_type = await sync_to_async(
+                        ContentType.objects.get_for_model
+                    )(image)
+                    await Action.objects.filter(
                         user=request.user,
                         verb="likes",
                         target_ct=content_type,
                         target_id=image.id,
-                    ).delete()
+                    ).adelete()
 
                 return JsonResponse({"status": "ok"})
             except Image.DoesNotExist:
                 pass
         return JsonResponse({"status": "error"})
 
+    def like(self, image, user):
+        Like = Image.users_like.through
+        with transaction.atomic():
+            _, created = Like.objects.get_or_create(image=image, user=user)
+            if created:
+                Image.objects.filter(id=image.id).update(
+                    total_likes=F("total_likes") + 1
+                )
+        return created
+
+    def unlike(self, image, user):
+        Like = Image.users_like.through
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(image=image, user=user).delete()
+            if deleted:
+                Image.objects.filter(id=image.id, total_likes__gt=0).update(
+                    total_likes=F("total_likes") - 1
+                )
+
 
 class ImageListView(LoginRequiredMixin, ListView):
     model = Image
@@ -122,14 +168,20 @@ class ImageListView(LoginRequiredMixin, ListView):
         return context
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().filter(status=Image.Status.READY)
         images_only = self.request.GET.get("images_only")
         if images_only:
             self.template_name = "images/image/list_images.html"
         return queryset
 
+    def get_paginate_by(self, queryset):
+        # get() paginates the images itself, the context gets a single page
+        return None
+
     def get(self, request, *args, **kwargs):
         self.object_list = self.get_queryset()
+        if settings.IMAGE_LIST_PAGINATION == "cursor" and "page" not in request.GET:
+            return self.get_cursor_page(request)
         paginator = self.get_paginator(self.object_list, self.paginate_by)
         page = request.GET.get("page")
 
@@ -147,17 +199,140 @@ class ImageListView(LoginRequiredMixin, ListView):
 
         return self.render_to_response(context)
 
+    def get_cursor_page(self, request):
+        paginator = CursorPaginator(
+            self.object_list, ("-created", "-id"), self.paginate_by
+        )
+        try:
+            images = paginator.page(request.GET.get("cursor"))
+        except InvalidCursor:
+            return HttpResponseBadRequest("Invalid cursor")
+        if request.GET.get("images_only") and not images:
+            return HttpResponse("")
+
+        context = self.get_context_data(object_list=images.object_list)
+        context["images"] = images
+        context["cursor_pagination"] = True
+        context["next_cursor"] = images.next_cursor
+
+        response = self.render_to_response(context)
+        if images.next_cursor:
+            response["X-Next-Cursor"] = images.next_cursor
+        return response
+
 
 class ImageRankingView(LoginRequiredMixin, TemplateView):
     template_name = "images/image/ranking.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        image_ranking = r.zrange("image_ranking", 0, -1, desc=True)[:10]  # type: ignore
-        image_ranking_ids = [int(id) for id in image_ranking]
-        # get most viewed images
-        most_viewed = list(Image.objects.filter(id__in=image_ranking_ids))
-        most_viewed.sort(key=lambda x: image_ranking_ids.index(x.id))  # type: ignore
+        window = self.request.GET.get("window", "all")
+        if window not in ("all", "unique") and window not in RANKING_WINDOWS:
+            window = "all"
+        try:
+            limit = int(self.request.GET.get("n", settings.IMAGE_RANKING_SIZE))
+        except ValueError:
+            limit = settings.IMAGE_RANKING_SIZE
+        limit = min(max(limit, 1), settings.IMAGE_RANKING_MAX_SIZE)
+        # only the top of the zset is transferred
+        try:
+            ranking = get_ranking(window, limit)
+        except redis.RedisError:
+            ranking = []
+        image_ranking_ids = [image_id for image_id, _ in ranking]
+        if not image_ranking_ids and window == "all":
+            # the counters are not available, use the written back totals
+            image_ranking_ids = list(
+                Image.objects.filter(total_views__gt=0)
+                .order_by("-total_views", "-id")
+                .values_list("id", flat=True)[:limit]
+            )
+        context["section"] = "images"
+        context["window"] = window
+        context["leaderboard"] = self.get_leaderboard(window, image_ranking_ids)
+        return context
+
+    def get_leaderboard(self, window, image_ranking_ids):
+        # the cache key changes as soon as score changes reorder the top
+        # images, so a cached leaderboard is never out of order
+        ranking = ",".join(str(id) for id in image_ranking_ids)
+        cache_key = f"image_ranking:{window}:{md5(ranking.encode()).hexdigest()}"
+        leaderboard = cache.get(cache_key)
+        if leaderboard is None:
+            # get most viewed images
+            images = Image.objects.in_bulk(image_ranking_ids)
+            most_viewed = [images[id] for id in image_ranking_ids if id in images]
+            leaderboard = render_to_string(
+                "images/image/ranking_list.html", {"most_viewed": most_viewed}
+            )
+            cache.set(cache_key, leaderboard, settings.IMAGE_RANKING_CACHE_TIMEOUT)
+        return leaderboard
+
+
+class ImageTrendingView(LoginRequiredMixin, TemplateView):
+    template_name = "images/image/trending.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            limit = int(self.request.GET.get("n", settings.IMAGE_RANKING_SIZE))
+        except ValueError:
+            limit = settings.IMAGE_RANKING_SIZE
+        limit = min(max(limit, 1), settings.IMAGE_RANKING_MAX_SIZE)
+        image_ids = [image_id for image_id, _ in trending.top(limit)]
+        images = Image.objects.in_bulk(image_ids)
         context["section"] = "images"
-        context["most_viewed"] = most_viewed
+        context["most_viewed"] = [images[id] for id in image_ids if id in images]
         return context
+
+
+class ImageSearchView(LoginRequiredMixin, ListView):
+    template_name = "images/image/search.html"
+    paginate_by = 8
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get("q", "").strip()
+        # fuzzy is set on the pages following a trigram fallback
+        fuzzy = bool(request.GET.get("fuzzy"))
+        cursor = request.GET.get("cursor")
+        images = None
+        if query:
+            try:
+                if not fuzzy:
+                    images = self.search(query, cursor)
+                if fuzzy or (not images and not cursor):
+                    # no exact match, try to correct typos in the title
+                    fuzzy = True
+                    images = self.search_similar(query, cursor)
+            except InvalidCursor:
+                return HttpResponseBadRequest("Invalid cursor")
+        context = {
+            "section": "images",
+            "query": query,
+            "images": images,
+            "fuzzy": fuzzy,
+            "next_cursor": images.next_cursor if images else None,
+        }
+        return render(request, self.template_name, context)
+
+    def search(self, query, cursor):
+        search_query = SearchQuery(query, config="english", search_type="websearch")
+        queryset = Image.objects.filter(
+            status=Image.Status.READY, search_vector=search_query
+        ).annotate(
+            # ts_rank is a real, cast it so cursor values round-trip exactly
+            rank=Cast(SearchRank(F("search_vector"), search_query), FloatField())
+        )
+        return CursorPaginator(queryset, ("-rank", "-id"), self.paginate_by).page(
+            cursor
+        )
+
+    def search_similar(self, query, cursor):
+        queryset = Image.objects.filter(
+            status=Image.Status.READY, title__trigram_similar=query
+        ).annotate(
+            similarity=Cast(TrigramSimilarity("title", query), FloatField())
+        )
+        return CursorPaginator(
+            queryset, ("-similarity", "-id"), self.paginate_by
+        ).page(cursor)
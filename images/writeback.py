@@ -0,0 +1,145 @@
+from django.db import connection, transaction
+
+from .counters import RANKING_KEY, r, views_delta_key, views_key
+from .models import Image
+
+DELTA_PATTERN = views_delta_key("*")
+
+
+def _image_id(key):
+    # image:{id}:views:delta, None for keys not written by the view counter
+    image_id = key.split(b":")[1]
+    return int(image_id) if image_id.isdigit() else None
+
+
+def _update_total_views(values, expression):
+    """
+    Update total_views of many images in a single statement, joining the
+    table to a VALUES list of (image id, value) rows.
+    """
+    table = connection.ops.quote_name(Image._meta.db_table)
+    rows = ", ".join(["(%s, %s)"] * len(values))
+    sql = (
+        f"UPDATE {table} SET total_views = {expression} "
+        f"FROM (VALUES {rows}) AS v (id, value) WHERE {table}.id = v.id"
+    )
+    params = [param for row in values for param in row]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def write_back_views(batch_size=1000, client=r):
+    """
+    Add the view deltas counted in Redis to Image.total_views and return
+    the number of views written.
+
+    GETDEL reads and resets each delta atomically, so views counted while
+    a batch is written go to a new delta key and are picked up next time.
+    """
+    written = 0
+    keys = []
+    for key in client.scan_iter(match=DELTA_PATTERN, count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            written += _write_back_batch(keys, client)
+            keys = []
+    if keys:
+        written += _write_back_batch(keys, client)
+    return written
+
+
+def _write_back_batch(keys, client):
+    # keys are parsed before any delta is read and reset
+    keys = [(key, _image_id(key)) for key in keys]
+    keys = [(key, image_id) for key, image_id in keys if image_id is not None]
+    if not keys:
+        return 0
+    pipe = client.pipeline(transaction=False)
+    for key, _ in keys:
+        pipe.getdel(key)
+    deltas = [
+        (image_id, int(delta))
+        for (_, image_id), delta in zip(keys, pipe.execute())
+        if delta is not None
+    ]
+    if not deltas:
+        return 0
+    try:
+        with transaction.atomic():
+            _update_total_views(deltas, "total_views + v.value")
+    except Exception:
+        # give the deltas back so they are written on the next run
+        pipe = client.pipeline(transaction=False)
+        for image_id, delta in deltas:
+            pipe.incrby(views_delta_key(image_id), delta)
+        pipe.execute()
+        raise
+    return sum(delta for _, delta in deltas)
+
+
+def import_views(batch_size=1000, client=r):
+    """
+    Set Image.total_views from the Redis counters, leaving out the views
+    still waiting to be written back. Used once to seed the column.
+    """
+    imported = 0
+    queryset = Image.objects.order_by("id").values_list("id", flat=True)
+    last_id = 0
+    while True:
+        image_ids = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not image_ids:
+            break
+        last_id = image_ids[-1]
+        pipe = client.pipeline(transaction=False)
+        for image_id in image_ids:
+            pipe.get(views_key(image_id))
+            pipe.get(views_delta_key(image_id))
+        results = pipe.execute()
+        values = [
+            (image_id, int(views or 0) - int(delta or 0))
+            for image_id, views, delta in zip(
+                image_ids, results[::2], results[1::2]
+            )
+            if views is not None
+        ]
+        if values:
+            imported += _update_total_views(values, "v.value")
+    return imported
+
+
+def rebuild_counters(batch_size=1000, client=r):
+    """
+    Restore the Redis view counters and all-time ranking from
+    Image.total_views, e.g. after Redis lost its data. Counters that are
+    ahead of the database are kept.
+    """
+    rebuilt = 0
+    queryset = (
+        Image.objects.filter(total_views__gt=0)
+        .order_by("id")
+        .values_list("id", "total_views")
+    )
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        pipe = client.pipeline(transaction=False)
+        for image_id, _ in rows:
+            pipe.get(views_key(image_id))
+            pipe.get(views_delta_key(image_id))
+        results = pipe.execute()
+        pipe = client.pipeline(transaction=False)
+        for (image_id, total_views), views, delta in zip(
+            rows, results[::2], results[1::2]
+        ):
+            total_views += int(delta or 0)
+            if views is not None and int(views) >= total_views:
+                continue
+            pipe.set(views_key(image_id), total_views)
+            pipe.zadd(RANKING_KEY, {image_id: total_views})
+            rebuilt += 1
+        pipe.execute()
+    return rebuilt